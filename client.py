@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from functools import partial
 import struct
 import sys
@@ -16,9 +17,10 @@ import events
 import focus
 import layers
 import frame
-import misc
+import timer
 import workspace
 import monitor
+import xerror
 import config.mousebind as mousebind
 
 # An alias for easy atom grabbing
@@ -26,6 +28,9 @@ import config.mousebind as mousebind
 aname = partial(util.get_atom_name, state.conn)
 aid = partial(util.get_atom, state.conn)
 
+# The event code of ConfigureNotify, for sending synthetic ones
+__configure_notify = 22
+
 def cb_MapRequestEvent(e):
     manage(e.window)
 
@@ -46,15 +51,18 @@ class Client(object):
     type if Pyndow wants to treat them similarly. Chief among different kinds
     of clients would be your typical or "normal" clients, desktops and docks.
     """
-    def __init__(self, wid):
-        self.win = window.Window(wid)
+    def __init__(self, win):
+        self.win = win
 
         self.workspace = None
         self.mapped = False
         self.initial_map = False
+        self.alive = True
         self.__unmap_ignore = 0
+        self.__unmap_pending = 0
 
         self.strut = self.strut_partial = None
+        self.__struts_stale = True
 
         state.conn.core.ChangeWindowAttributes(
             self.win.id, xcb.xproto.CW.EventMask,
@@ -115,11 +123,17 @@ class Client(object):
     def parent_id(self):
         return self.win.id
 
+    def root_position(self):
+        """Returns where the client window is, relative to the root."""
+        return self.win.geom['x'], self.win.geom['y']
+
     def unlisten(self):
         state.conn.core.ChangeWindowAttributes(self.win.id,
                                                xcb.xproto.CW.EventMask, [])
 
     def unmanage(self):
+        self.alive = False
+
         if self.mapped:
             self.unmapped()
 
@@ -134,6 +148,8 @@ class Client(object):
         events.unregister_window(self.win.id)
         del state.windows[self.win.id]
 
+        hooks.fire('client_unmanage', self)
+
     def configure(self, **kwargs):
         self.win.configure(**kwargs)
 
@@ -146,12 +162,10 @@ class Client(object):
             state.conn.core.KillClientChecked(self.win.id)
 
     def stack_raise(self):
-        self.layer.above(self)
-        self.layer.stack()
+        self.layer.raise_window(self)
 
     def stack_lower(self):
-        self.layer.below(self)
-        self.layer.stack()
+        self.layer.lower_window(self)
 
     def is_focusable(self):
         """
@@ -175,79 +189,81 @@ class Client(object):
         self.win.unmap()
         self.unmapped(light=light)
 
-    def stop_timeout(self):
-        state.conn.core.ChangeProperty(xcb.xproto.PropMode.Replace,
-                                       self.win.id, aid('_PYNDOW_CMD_TIMEOUT'),
-                                       xcb.xproto.Atom.CARDINAL, 32, 1, [0])
-        state.conn.flush()
-
-    def is_in_timeout(self):
-        cookie = util.get_property(state.conn, self.win.id,
-                                   aid('_PYNDOW_CMD_TIMEOUT'))
-        check = util.PropertyCookieSingle(cookie).reply()
+    def expect_unmap(self):
+        """
+        Tells the client that an UnmapNotify is coming that it shouldn't take
+        as the window withdrawing itself. (i.e., reparenting a window that is
+        already mapped.)
+        """
+        self.__unmap_ignore += 1
 
-        if check is None:
-            return False
+    def stop_timeout(self):
+        timer.cancel_owner(self.win.id)
 
-        check = int(check)
+        # A pyndow-cmd started from the command line keeps going for as long
+        # as this property is set on the window.
+        xerror.send('stop_timeout', state.conn.core.ChangeProperty,
+                    xcb.xproto.PropMode.Replace, self.win.id,
+                    aid('_PYNDOW_CMD_TIMEOUT'), xcb.xproto.Atom.CARDINAL,
+                    32, 1, [0])
 
-        return check == 1
+    def is_in_timeout(self):
+        return timer.active(self.win.id)
 
     def is_alive(self):
         """
         A useful auxiliary method to determine if a client is alive and can
-        still be used. This is achieved at peeking to see if an unmap event
-        has been queued up.
+        still be used. A client is dead once it has been unmanaged, or as
+        soon as the event loop sees a DestroyNotify or an unexpected
+        UnmapNotify for it in the batch of events being processed. (See
+        'note_pending'.) No round trip to the server is made.
         """
-        state.sync()
-
-        event.read(state.conn)
-        ignore = self.__unmap_ignore
-
-        for e in event.peek():
-            if (isinstance(e, xcb.xproto.UnmapNotifyEvent) and
-                e.window == self.win.id):
-                if not ignore:
-                    return False
+        return self.alive
 
-                ignore = max(ignore - 1, 0)
-
-        return True
-
-    def update_title(self, atom):
+    def unmap_pending(self):
         """
-        Updates the 'wmname' attribute of a window object. Prefers EWMH and
-        falls back to ICCCM if necessary. If no name can be found, use an empty
-        string.
+        Called by the event loop for each UnmapNotify event that is queued up
+        for this client, before the event is dispatched. If there are more of
+        them than we're expecting (from our own unmaps), the client is on its
+        way out.
         """
-        assert atom in ('_NET_WM_NAME', 'WM_NAME')
-
-        # If the window has a _NET_WM_NAME property, ignore WM_NAME
-        if atom == 'WM_NAME' and aid('_NET_WM_NAME') in self.win.properties:
-            return
+        self.__unmap_pending += 1
 
-        new_name = ''
-        if atom == '_NET_WM_NAME':
-            new_name = ewmh.get_wm_name(state.conn, self.win.id).reply()
-        elif atom == 'WM_NAME':
-            new_name = icccm.get_wm_name(state.conn, self.win.id).reply()
+        if self.__unmap_pending > self.__unmap_ignore:
+            self.alive = False
 
+    def set_title(self, new_name):
+        """
+        Updates the 'wmname' attribute of a window object. Returns whether
+        the name actually changed.
+        """
         # Don't update if it's the same...
         if new_name == self.win.wmname:
-            return
+            return False
 
         self.win.wmname = new_name
 
-    def update_struts(self):
-        old_strut, old_strut_partial = self.strut, self.strut_partial
+        return True
 
-        if self.mapped:
-            self.strut = ewmh.get_wm_strut(state.conn, self.win.id).reply()
-            self.strut_partial = ewmh.get_wm_strut_partial(state.conn, 
-                                                           self.win.id).reply()
+    def update_struts(self, refresh=False):
+        """
+        Recalculates the workareas if this client's struts matter to them.
+        The struts are only fetched again if they've changed (i.e., 'refresh'
+        is set from a PropertyNotify) since we last saw them, so mapping and
+        unmapping clients doesn't cost any round trips.
+        """
+        if refresh:
+            self.__struts_stale = True
 
-        if any((old_strut, old_strut_partial, self.strut, self.strut_partial)):
-            monitor.strut_calculate()
+        if self.mapped and self.__struts_stale:
+            strut = ewmh.get_wm_strut(state.conn, self.win.id)
+            strut_partial = ewmh.get_wm_strut_partial(state.conn, self.win.id)
+
+            self.strut = strut.reply()
+            self.strut_partial = strut_partial.reply()
+            self.__struts_stale = False
+
+        monitor.set_struts(self)
 
     # Event callbacks
 
@@ -275,7 +291,7 @@ class Client(object):
         """
         This callback occurs when a managed client wants to configure itself.
         As of right now, simply pass it along. (But it does get validated if
-        it's in a frame.)
+        it's in a frame, and restacking goes through its layer.)
         """
         x = y = width = height = border_width = sibling = stack_mode = None
         conf = xcb.xproto.ConfigWindow
@@ -296,9 +312,31 @@ class Client(object):
         if conf.StackMode & mask:
             stack_mode = e.stack_mode
 
+        geom = self.win.geom
+        size = (geom['width'], geom['height'])
+
         self.configure(x=x, y=y, width=width, height=height, 
-                       border_width=border_width, sibling=sibling, 
-                       stack_mode=stack_mode)
+                       border_width=border_width)
+
+        # Restacking goes through the client's layer, so that the layers
+        # keep matching what's on the screen. Only plain raising and lowering
+        # can be done that way; anything else isn't honored. Unmapped clients
+        # get raised when they're mapped anyway.
+        if sibling is None and self.mapped:
+            if stack_mode == xcb.xproto.StackMode.Above:
+                self.stack_raise()
+            elif stack_mode == xcb.xproto.StackMode.Below:
+                self.stack_lower()
+
+        # Nothing is sent for values that didn't change, and moving the frame
+        # doesn't move the client relative to its parent. Either way, the
+        # client won't get a real ConfigureNotify unless it was resized, so
+        # it gets a synthetic one instead. (ICCCM 4.1.5)
+        # The position in it comes from the cached geometry, which already
+        # has any move in it, so the move has to reach the server first.
+        if (geom['width'], geom['height']) == size:
+            window.flush_configures(self.parent_id())
+            send_configure_notify(self)
 
     def cb_MapRequestEvent(self, e):
         """
@@ -312,6 +350,7 @@ class Client(object):
         Although we typically won't get to this point (since we unmanage a
         client at Unmap), if we do, simple unmanage it.
         """
+        self.alive = False
         self.unmanage()
 
     def cb_UnmapNotifyEvent(self, e):
@@ -319,6 +358,8 @@ class Client(object):
         If we get an unmap event and there are no unmap events to ignore,
         stop managing the client immediately.
         """
+        self.__unmap_pending = max(self.__unmap_pending - 1, 0)
+
         if not self.mapped:
             return
 
@@ -343,12 +384,17 @@ class Client(object):
         a = aname(e.atom)
 
         if a in ('_NET_WM_NAME', 'WM_NAME'):
-            self.update_title(a)
+            queue_title_update(self)
         elif a == 'WM_NORMAL_HINTS':
             self.win.normal_hints = icccm.get_wm_normal_hints(state.conn,
                                                               self.win.id)
         elif a in ('_NET_WM_STRUT', '_NET_WM_STRUT_PARTIAL'):
-            self.update_struts()
+            self.update_struts(refresh=True)
+        elif a == 'WM_HINTS':
+            self.win.hints = icccm.get_wm_hints(state.conn, self.win.id)
+            hooks.fire('client_icon_changed', self)
+        elif a == '_NET_WM_ICON':
+            hooks.fire('client_icon_changed', self)
 
         if (e.state == xcb.xproto.Property.Delete and
             e.atom in self.win.properties):
@@ -375,8 +421,8 @@ class Client(object):
         return self.win.wmname
 
 class DockClient(Client):
-    def __init__(self, wid):
-        Client.__init__(self, wid)
+    def __init__(self, win):
+        Client.__init__(self, win)
 
         mousebind.register('non-client', self, self.win.id)
 
@@ -396,8 +442,10 @@ class DockClient(Client):
 
         # START GRAB
         state.grab()
-        self.win.map()
-        state.ungrab()
+        try:
+            self.win.map()
+        finally:
+            state.ungrab()
         # END GRAB
 
         self.mapped = True
@@ -417,8 +465,10 @@ class DockClient(Client):
 
         # START GRAB
         state.grab()
-        self.win.map()
-        state.ungrab()
+        try:
+            self.win.map()
+        finally:
+            state.ungrab()
         # END GRAB
 
         self.initial_map = True
@@ -432,11 +482,11 @@ class DockClient(Client):
         self.mapped = False
         self.update_struts()
 
-        state.conn.flush()
+        state.flush()
 
 class NormalClient(Client):
-    def __init__(self, wid):
-        Client.__init__(self, wid)
+    def __init__(self, win):
+        Client.__init__(self, win)
 
         self.catchall = False # Temp
         self.maximized = False # Temp
@@ -468,10 +518,12 @@ class NormalClient(Client):
 
         # START GRAB
         state.grab()
-        self.win.map()
-        self.frame.map()
-        self.focus()
-        state.ungrab()
+        try:
+            self.win.map()
+            self.frame.map()
+            self.focus()
+        finally:
+            state.ungrab()
         # END GRAB
 
         self.initial_map = True
@@ -488,9 +540,11 @@ class NormalClient(Client):
 
         # START GRAB
         state.grab()
-        self.win.map()
-        self.frame.map()
-        state.ungrab()
+        try:
+            self.win.map()
+            self.frame.map()
+        finally:
+            state.ungrab()
         # END GRAB
 
         self.mapped = True
@@ -509,13 +563,13 @@ class NormalClient(Client):
                 focus.fallback()
             self.workspace.hide_client(self)
 
-        state.conn.flush()
+        state.flush()
 
     def focus(self):
         if self.win.hints['input'] == 1:
-            state.conn.core.SetInputFocusChecked(
-                xcb.xproto.InputFocus.PointerRoot,
-                self.win.id, xcb.xproto.Time.CurrentTime).check()
+            xerror.send('focus', state.conn.core.SetInputFocus,
+                        xcb.xproto.InputFocus.PointerRoot,
+                        self.win.id, xcb.xproto.Time.CurrentTime)
 
             self.focused()
         elif aid('WM_TAKE_FOCUS') in self.win.protocols:
@@ -540,12 +594,12 @@ class NormalClient(Client):
         else:
             workspace.determine_focus()
 
-        focus.above(self)
+        previous = focus.above(self)
         self.attention_stop()
         # self.frame.set_state(frame.State.Active) 
 
-        for client in focus.get_stack()[:-1]:
-            client.unfocused()
+        if previous is not None and previous is not self:
+            previous.unfocused()
 
     def unfocused(self):
         Client.unfocused(self)
@@ -564,6 +618,11 @@ class NormalClient(Client):
     def parent_id(self):
         return self.frame.parent.id
 
+    def root_position(self):
+        geom = self.frame.parent.geom
+        return (geom['x'] + self.frame.pos['client']['x'],
+                geom['y'] + self.frame.pos['client']['y'])
+
     def unmanage(self):
         if self.mapped:
             self.unmapped()
@@ -575,6 +634,14 @@ class NormalClient(Client):
     def configure(self, **kwargs):
         self.frame.configure_client(**kwargs)
 
+    def set_title(self, new_name):
+        if not Client.set_title(self, new_name):
+            return False
+
+        self.frame.title_changed()
+
+        return True
+
     def is_focusable(self):
         return (aid('WM_TAKE_FOCUS') in self.win.protocols
                 or self.win.hints['input'] == 1)
@@ -593,7 +660,7 @@ class NormalClient(Client):
         elif slim:
             frame.switch(self.frame, frame.SlimBorder)
         else:
-            frame.switch(self.frame, frame.Full)
+            frame.switch(self.frame, frame.Decorated)
 
     def undecorate(self):
         frame.switch(self.frame, frame.Nada)
@@ -606,7 +673,7 @@ class NormalClient(Client):
         if self.is_in_timeout():
             return
 
-        misc.command('toggle_framestate', self.win.id, 500, 100)
+        timer.interval(500, self.toggle_framestate, 100, owner=self.win.id)
 
     def attention_stop(self):
         if not self.is_in_timeout():
@@ -620,7 +687,7 @@ class NormalClient(Client):
             self.unfocused()
 
     def frame_full(self):
-        frame.switch(self.frame, frame.Full)
+        frame.switch(self.frame, frame.Decorated)
 
     def frame_border(self):
         frame.switch(self.frame, frame.Border)
@@ -634,6 +701,7 @@ class NormalClient(Client):
     def toggle_decorations(self):
         if (isinstance(self.frame, frame.Border) or
             isinstance(self.frame, frame.Full) or
+            isinstance(self.frame, frame.Composite) or
             isinstance(self.frame, frame.SlimBorder)):
             self.undecorate()
         else:
@@ -671,7 +739,7 @@ class NormalClient(Client):
                 return frame.Nada
             return frame.SlimBorder
 
-        return frame.Full
+        return frame.Decorated
 
     # I think a lot of these callbacks are a bit awkward here.
     # I don't think they'll stay.
@@ -700,47 +768,178 @@ class NormalClient(Client):
     def cmd_toggle_framestate(self):
         self.toggle_framestate()
 
-def get(wid):
-    return state.windows.setdefault(wid, None)
+def note_pending(xevents):
+    """
+    Looks through a batch of events before it is dispatched, and lets each
+    client know about any UnmapNotify or DestroyNotify events headed its
+    way. This is what keeps 'Client.is_alive' up to date.
+    """
+    for e in xevents:
+        if isinstance(e, xcb.xproto.UnmapNotifyEvent):
+            client = state.windows.get(e.window)
+            if client is not None:
+                client.unmap_pending()
+        elif isinstance(e, xcb.xproto.DestroyNotifyEvent):
+            client = state.windows.get(e.window)
+            if client is not None:
+                client.alive = False
+
+# Clients whose name has changed during the current batch of events.
+# Rather than asking for the new name as each PropertyNotify comes in, the
+# names are all requested at once when the batch has been dispatched.
+__titles = set()
+
+def queue_title_update(client):
+    __titles.add(client)
+    events.register_latent_callback(update_titles)
+
+def update_titles():
+    """
+    Fetches the names of every client queued with 'queue_title_update'.
+    Prefers EWMH and falls back to ICCCM if necessary. If no name can be
+    found, use an empty string.
+    """
+    global __titles
 
-def manage(wid):
-    windowtypes = ewmh.get_wm_window_type(state.conn, wid).reply()
-    if windowtypes:
-        primary = aname(windowtypes[0])
-        if primary == '_NET_WM_WINDOW_TYPE_DOCK':
-            client = DockClient(wid)
+    clients, __titles = __titles, set()
+
+    # Send every request before waiting on any of the replies...
+    cookies = []
+    for client in clients:
+        # Might have been unmanaged later on in the same batch
+        if state.windows.get(client.win.id) is not client:
+            continue
+
+        # If the window has a _NET_WM_NAME property, ignore WM_NAME
+        if aid('_NET_WM_NAME') in client.win.properties:
+            ck = ewmh.get_wm_name(state.conn, client.win.id)
         else:
-            client = NormalClient(wid)
-    else:
-        client = NormalClient(wid)
+            ck = icccm.get_wm_name(state.conn, client.win.id)
+        cookies.append((client, ck))
 
-    state.windows[wid] = client
+    for client, ck in cookies:
+        try:
+            new_name = ck.reply()
+        except xcb.xproto.BadWindow:
+            continue
 
-    # If the initial state is iconic, don't map...
-    if (not client.win.hints['flags']['State'] or
-        client.win.hints['initial_state'] != icccm.State.Iconic):
-        client.map()
-    return state.windows[wid]
+        client.set_title(new_name or '')
 
-#def manage_existing(wid):
-    #try:
-        #attrs = state.conn.core.GetWindowAttributes(wid).reply()
-    #except xcb.xproto.BadWindow:
-        #return False
+def get(wid):
+    return state.windows.setdefault(wid, None)
 
-    #state.debug('Got window attrs: %d' % wid)
+# Windows that have asked to be managed during the current batch of events,
+# along with the requests sent for them. (See 'manage'.)
+__pending = OrderedDict()
+
+def manage(wid):
+    """
+    Starts managing a window in two steps. Right now, every request needed to
+    create the client is sent off. The client itself is created once the
+    current batch of events has been dispatched (in 'manage_pending'). That
+    way, a burst of MapRequests costs a single round trip.
+    """
+    if wid in __pending or state.windows.get(wid) is not None:
+        return
 
-    #if attrs.map_state is not xcb.xproto.MapState.Viewable:
-        #return False
+    # Creating the window object sends off requests for its geometry,
+    # hints and such.
+    __pending[wid] = (window.Window(wid),
+                      ewmh.get_wm_window_type(state.conn, wid))
+    events.register_latent_callback(manage_pending)
 
-    #try:
-        #hints = icccm.get_wm_hints(state.conn, wid).reply()
-    #except xcb.xproto.BadWindow:
-        #return False
+def send_configure_notify(client):
+    """
+    Sends a synthetic ConfigureNotify to a client, with its position relative
+    to the root window.
+    """
+    x, y = client.root_position()
+    geom = client.win.geom
+
+    packed = struct.pack('=BxHIIIhhHHHB5x', __configure_notify, 0,
+                         client.win.id, client.win.id, 0, x, y,
+                         geom['width'], geom['height'], geom['border_width'],
+                         0)
+    event.send_event(state.conn, client.win.id,
+                     xcb.xproto.EventMask.StructureNotify, packed)
+
+def manage_pending():
+    global __pending
+
+    pending, __pending = __pending, OrderedDict()
+
+    # START GRAB
+    state.grab()
+    try:
+        for win, windowtypes in pending.itervalues():
+            try:
+                windowtypes = windowtypes.reply()
+                win.resolve()
+            except (xcb.xproto.BadWindow, xcb.xproto.BadDrawable):
+                continue
+
+            client = __create(win, windowtypes)
+
+            # If the initial state is iconic, don't map...
+            if (not client.win.hints['flags']['State'] or
+                client.win.hints['initial_state'] != icccm.State.Iconic):
+                client.map()
+    finally:
+        state.ungrab()
+    # END GRAB
 
-    #state.debug('Got window hints: %d' % wid)
+def manage_existing():
+    """
+    Adopts every window that was already mapped when we started. Every
+    request for every window is sent before any reply is waited on, so this
+    costs about the same no matter how many windows there are.
+    """
+    children = state.core.QueryTree(state.root).reply().children
+
+    pending = []
+    for wid in children:
+        # Creating the window object sends off requests for its geometry,
+        # hints and such.
+        pending.append((window.Window(wid),
+                        state.core.GetWindowAttributes(wid),
+                        ewmh.get_wm_window_type(state.conn, wid)))
+
+    # START GRAB
+    state.grab()
+    try:
+        for win, attrs, windowtypes in pending:
+            try:
+                attrs = attrs.reply()
+                if (attrs.override_redirect or
+                    attrs.map_state != xcb.xproto.MapState.Viewable):
+                    continue
+
+                windowtypes = windowtypes.reply()
+                win.resolve()
+            except (xcb.xproto.BadWindow, xcb.xproto.BadDrawable):
+                continue
+
+            client = __create(win, windowtypes)
+
+            # Putting it in a frame will unmap it.
+            if isinstance(client, NormalClient):
+                client.expect_unmap()
+
+            client.map()
+    finally:
+        state.ungrab()
+    # END GRAB
+
+def __create(win, windowtypes):
+    if windowtypes:
+        primary = aname(windowtypes[0])
+        if primary == '_NET_WM_WINDOW_TYPE_DOCK':
+            client = DockClient(win)
+        else:
+            client = NormalClient(win)
+    else:
+        client = NormalClient(win)
 
-    #if hints['initial_state'] not in (icccm.State.Normal, icccm.State.Iconic):
-        #return False
+    state.windows[win.id] = client
 
-    #manage(wid)
+    return client
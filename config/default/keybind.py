@@ -4,6 +4,7 @@ import state
 import focus
 import workspace
 import misc
+import tracer
 import popup.cycle
 
 from client import Client, NormalClient
@@ -75,6 +76,9 @@ keybinds = {
     'Mod1-comma':       wla('master_decrement'),
     'Mod1-period':      wla('master_increment'),
 
+    'Control-Mod1-t':   tracer.toggle,
+    'Control-Mod1-p':   tracer.dump,
+
     'Control-Mod1-c':   quit,
     }
 
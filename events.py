@@ -7,12 +7,17 @@ import xpybutil.ewmh as ewmh
 import xpybutil.keysym as keysym
 
 import state
+import tracer
+import xerror
 import grab as grabber
 
 # The __events dictionary is keyed by the X event and then by window.
 # Additional criteria (like key binding, mouse binding) can
-# then be specified in a sub-dictionary
-__events = defaultdict(defaultdict)
+# then be specified in a sub-dictionary.
+# The callbacks themselves are stored in tuples that are replaced rather than
+# modified. This is so dispatch can iterate over them without making a copy,
+# even when a callback unregisters itself.
+__events = defaultdict(dict)
 
 # This is what needs to be executed sparingly. For example, there may
 # be several Expose events, but only one redraw event would be necessary.
@@ -67,11 +72,10 @@ def register_callback(xevent, callback, wid, modifiers=None,
             register_callback(xevent, cb, wid, modifiers, keycode, button)
     except TypeError:
         modkey = (modifiers, keycode, button)
-        if wid not in __events[xevent]:
-            __events[xevent][wid] = defaultdict(list)
+        callbacks = __events[xevent].setdefault(wid, {}).get(modkey, ())
 
-        if callback not in __events[xevent][wid][modkey]:
-            __events[xevent][wid][modkey].append(callback)
+        if callback not in callbacks:
+            __events[xevent][wid][modkey] = callbacks + (callback,)
 
             return True
 
@@ -93,7 +97,8 @@ def unregister_callback(xevent, callback, wid, modifiers=None, keycode=None,
     if callback not in callbacks:
         return False
 
-    __events[xevent][wid][modkey].remove(callback)
+    __events[xevent][wid][modkey] = tuple([cb for cb in callbacks
+                                           if cb != callback])
 
     return True
 
@@ -298,9 +303,77 @@ def empty_latent():
     __latent = set()
 
 def run_latent():
-    for latent in __latent:
-        latent()
-    empty_latent()
+    global __latent
+
+    # Latent callbacks may register more latent callbacks (i.e., managing a
+    # new client), so keep going until there are none left.
+    while __latent:
+        latent, __latent = __latent, set()
+        for cb in latent:
+            cb()
+
+def compress_motion(xevents):
+    """
+    Drops every MotionNotify event that is followed by a newer MotionNotify
+    event for the same window, without any other event in between. That
+    way, things like drags only respond to the latest pointer position in
+    each batch of events, rather than every pointer sample.
+
+    Returns a list of the remaining events, in order.
+    """
+    compressed = []
+    seen = set()
+
+    for e in reversed(list(xevents)):
+        if isinstance(e, xcb.xproto.MotionNotifyEvent):
+            if e.event in seen:
+                continue
+            seen.add(e.event)
+        else:
+            seen.clear()
+
+        compressed.append(e)
+
+    compressed.reverse()
+
+    return compressed
+
+def register_extension_event(xevent, callback):
+    """
+    Extension events have response types that are only known at runtime,
+    so they aren't in the dispatch table. Instead, they are dispatched by
+    their class to a single callback.
+    """
+    __dispatch_ext[xevent] = callback
+
+def read(block=False):
+    """
+    Reads every event waiting on the connection, and returns them oldest
+    first. If 'block' is set, wait for at least one. This is just like
+    'xpybutil.event.read', except that X errors from unchecked requests are
+    handed to 'xerror.caught' instead of being raised.
+    """
+    xevents = []
+
+    if block:
+        try:
+            xevents.append(state.conn.wait_for_event())
+        except xcb.ProtocolException, err:
+            xerror.caught(err)
+
+    while True:
+        try:
+            e = state.conn.poll_for_event()
+        except xcb.ProtocolException, err:
+            xerror.caught(err)
+            continue
+
+        if not e:
+            break
+
+        xevents.append(e)
+
+    return xevents
 
 def dispatch(xevent):
     global time
@@ -312,82 +385,65 @@ def dispatch(xevent):
     if hasattr(xevent, 'time'):
         time = xevent.time
 
-    # WHY!?
-    if xevent.response_type == 161:
-        xevent = xcb.xproto.ClientMessageEvent(xevent)
-
-    state.debug_obj(xevent, True)
-
-    #if hasattr(xevent, 'window'):
-        #try:
-            #state.debug(ewmh.get_wm_name(state.conn, xevent.window).reply())
-        #except:
-            #pass
-
-    dname = 'dispatch_%s' % xevent.__class__.__name__
-    if dname in globals():
-        globals()[dname](xevent)
-    #else:
-        #state.debug(xevent)
+    # The high bit of the response type is set when an event was sent with
+    # SendEvent. xpyb doesn't know how to wrap those (i.e., client messages
+    # sent from other clients), so we do it ourselves.
+    handler = __dispatch.get(xevent.response_type & 0x7f)
+    if handler is None:
+        if xevent.__class__ in __dispatch_ext:
+            __dispatch_ext[xevent.__class__](xevent)
+        return True
+
+    if not isinstance(xevent, handler[0]):
+        xevent = handler[0](xevent)
+
+    if tracer.enabled:
+        start = tracer.clock()
+        handler[1](xevent, handler[2])
+        tracer.record(xevent, handler[1], start)
+    else:
+        handler[1](xevent, handler[2])
 
     return True
 
-def __dispatch_fetch_callbacks(xevent, wid, modifiers, keycode, button):
-    if xevent not in __events:
-        return []
-
-    if wid not in __events[xevent] or not __events[xevent][wid]:
-        return []
-
-    modkey = (modifiers, keycode, button)
-
-    # Return a copy in case we unregister in a callback
-    return __events[xevent][wid].setdefault(modkey, [])[:]
+def __dispatch_fetch_callbacks(index, wid, modifiers, keycode, button):
+    # Callback lists are immutable tuples, so there's no need for a copy
+    # in case we unregister in a callback.
+    try:
+        return index[wid][(modifiers, keycode, button)]
+    except KeyError:
+        return ()
 
-def dispatch_ClientMessageEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.ClientMessageEvent, e.window,
-                                     None, None, None)
+def __button_mods(state_mask, button):
+    return state_mask & ~(__trivial_mods | __button_masks.get(button, 0))
 
-    for cb in cbs:
+def dispatch_ClientMessageEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.window, None, None, None):
         cb(e=e)
 
-def dispatch_ButtonPressEvent(e):
+def dispatch_ButtonPressEvent(e, index):
     if state.grab_pointer and grabber.dragging:
         mods = None
         button = None
     else:
         button = e.detail
-        button_mask = getattr(xcb.xproto.KeyButMask, 'Button%d' % button)
-        mods = e.state
+        mods = __button_mods(e.state, button)
 
-        for mod in keysym.TRIVIAL_MODS + [button_mask]:
-            mods &= ~mod
-
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.ButtonPressEvent, e.event,
-                                     mods, None, button)
-
-    for cb in cbs:
+    for cb in __dispatch_fetch_callbacks(index, e.event, mods, None, button):
         cb(e=e)
 
-def dispatch_ButtonReleaseEvent(e):
+def dispatch_ButtonReleaseEvent(e, index):
     if state.grab_pointer and grabber.dragging:
         mods = None
         button = None
     else:
         button = e.detail
-        button_mask = getattr(xcb.xproto.KeyButMask, 'Button%d' % button)
-        mods = e.state
-
-        for mod in keysym.TRIVIAL_MODS + [button_mask]:
-            mods &= ~mod
-
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.ButtonReleaseEvent,
-                                     e.event, mods, None, button)
+        mods = __button_mods(e.state, button)
 
-    for cb in cbs:
+    for cb in __dispatch_fetch_callbacks(index, e.event, mods, None, button):
         cb(e=e)
 
-def dispatch_MotionNotifyEvent(e):
+def dispatch_MotionNotifyEvent(e, index):
     if state.grab_pointer and grabber.dragging:
         mods = None
         button = None
@@ -396,26 +452,19 @@ def dispatch_MotionNotifyEvent(e):
         button = None
 
         for i in xrange(1, 6):
-            if mods & getattr(xcb.xproto.KeyButMask, 'Button%d' % i):
+            if mods & __button_masks[i]:
                 button = i
                 break
 
         if button is not None:
-            button_mask = getattr(xcb.xproto.KeyButMask, 'Button%d' % button)
-            for mod in keysym.TRIVIAL_MODS + [button_mask]:
-                mods &= ~mod
-
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.MotionNotifyEvent, e.event,
-                                     mods, None, button)
+            mods = __button_mods(mods, button)
 
-    for cb in cbs:
+    for cb in __dispatch_fetch_callbacks(index, e.event, mods, None, button):
         cb(e=e)
 
-def __dispatch_KeyEvent(e, xevent):
+def __dispatch_KeyEvent(e, index, release):
     keycode = e.detail
-    mods = e.state
-    for mod in keysym.TRIVIAL_MODS:
-        mods &= ~mod
+    mods = e.state & ~__trivial_mods
 
     # If there's a grab, we should always redirect key events to a
     # special pyndow window. This is because the grab may not happen quickly
@@ -427,104 +476,103 @@ def __dispatch_KeyEvent(e, xevent):
         # (Idea taken from Openbox, but I use GetModifierMapping)
         mods &= ~state.get_mod_for_key(keycode)
 
-        if (xevent == xcb.xproto.KeyReleaseEvent and 
+        if (release and 
             grabber.grabbed_mods and not (mods & grabber.grabbed_mods)):
             grabber.key_end(e)
             return
 
-    cbs = __dispatch_fetch_callbacks(xevent, e.event, mods, keycode, None)
-
-    for cb in cbs:
+    for cb in __dispatch_fetch_callbacks(index, e.event, mods, keycode, None):
         cb(e=e)
 
-def dispatch_KeyPressEvent(e):
-    __dispatch_KeyEvent(e, xcb.xproto.KeyPressEvent)
+def dispatch_KeyPressEvent(e, index):
+    __dispatch_KeyEvent(e, index, False)
 
-def dispatch_KeyReleaseEvent(e):
-    __dispatch_KeyEvent(e, xcb.xproto.KeyReleaseEvent)
+def dispatch_KeyReleaseEvent(e, index):
+    __dispatch_KeyEvent(e, index, True)
 
-def dispatch_ConfigureRequestEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.ConfigureRequestEvent,
-                                     e.window, None, None, None)
+def dispatch_ConfigureRequestEvent(e, index):
+    cbs = __dispatch_fetch_callbacks(index, e.window, None, None, None)
 
     if not cbs:
-        cbs = __dispatch_fetch_callbacks(xcb.xproto.ConfigureRequestEvent,
-                                         e.parent, None, None, None)
+        cbs = __dispatch_fetch_callbacks(index, e.parent, None, None, None)
 
     for cb in cbs:
         cb(e=e)
 
-def dispatch_MapRequestEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.MapRequestEvent, e.window,
-                                     None, None, None)
+def dispatch_MapRequestEvent(e, index):
+    cbs = __dispatch_fetch_callbacks(index, e.window, None, None, None)
 
     if not cbs:
-        cbs = __dispatch_fetch_callbacks(xcb.xproto.MapRequestEvent, e.parent,
-                                         None, None, None)
+        cbs = __dispatch_fetch_callbacks(index, e.parent, None, None, None)
 
     for cb in cbs:
         cb(e=e)
 
-def dispatch_DestroyNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.DestroyNotifyEvent, e.window,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_DestroyNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.window, None, None, None):
         cb(e=e)
 
-def dispatch_UnmapNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.UnmapNotifyEvent, e.window,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_UnmapNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.window, None, None, None):
         cb(e=e)
 
-def dispatch_FocusInEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.FocusInEvent, e.event,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_FocusInEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.event, None, None, None):
         cb(e=e)
 
-def dispatch_FocusOutEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.FocusOutEvent, e.event,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_FocusOutEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.event, None, None, None):
         cb(e=e)
 
-def dispatch_ExposeEvent(e):
-    state.debug_obj(e)
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.ExposeEvent, e.window,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_ExposeEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.window, None, None, None):
         cb(e=e)
 
-def dispatch_PropertyNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.PropertyNotifyEvent, e.window,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_PropertyNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.window, None, None, None):
         cb(e=e)
 
-def dispatch_EnterNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.EnterNotifyEvent, e.event,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_EnterNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.event, None, None, None):
         cb(e=e)
 
-def dispatch_LeaveNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.LeaveNotifyEvent, e.event,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_LeaveNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, e.event, None, None, None):
         cb(e=e)
 
-def dispatch_MappingNotifyEvent(e):
-    cbs = __dispatch_fetch_callbacks(xcb.xproto.MappingNotifyEvent, state.root,
-                                     None, None, None)
-
-    for cb in cbs:
+def dispatch_MappingNotifyEvent(e, index):
+    for cb in __dispatch_fetch_callbacks(index, state.root, None, None, None):
         cb(e=e)
+
+# Modifier masks that are stripped from every key/button event. These are
+# computed once here instead of on every event.
+__trivial_mods = reduce(lambda a, b: a | b, keysym.TRIVIAL_MODS, 0)
+__button_masks = dict([(i, getattr(xcb.xproto.KeyButMask, 'Button%d' % i))
+                       for i in xrange(1, 6)])
+
+# The dispatch table. It is keyed by the (core protocol) response type of an
+# event and holds the event class, its dispatch function and the window index
+# for that event in __events. The window index is the same dictionary that
+# register_callback adds to, so it never needs to be looked up again.
+__dispatch = {}
+__dispatch_ext = {}
+for code, xevent, handler in (
+        (2, xcb.xproto.KeyPressEvent, dispatch_KeyPressEvent),
+        (3, xcb.xproto.KeyReleaseEvent, dispatch_KeyReleaseEvent),
+        (4, xcb.xproto.ButtonPressEvent, dispatch_ButtonPressEvent),
+        (5, xcb.xproto.ButtonReleaseEvent, dispatch_ButtonReleaseEvent),
+        (6, xcb.xproto.MotionNotifyEvent, dispatch_MotionNotifyEvent),
+        (7, xcb.xproto.EnterNotifyEvent, dispatch_EnterNotifyEvent),
+        (8, xcb.xproto.LeaveNotifyEvent, dispatch_LeaveNotifyEvent),
+        (9, xcb.xproto.FocusInEvent, dispatch_FocusInEvent),
+        (10, xcb.xproto.FocusOutEvent, dispatch_FocusOutEvent),
+        (12, xcb.xproto.ExposeEvent, dispatch_ExposeEvent),
+        (17, xcb.xproto.DestroyNotifyEvent, dispatch_DestroyNotifyEvent),
+        (18, xcb.xproto.UnmapNotifyEvent, dispatch_UnmapNotifyEvent),
+        (20, xcb.xproto.MapRequestEvent, dispatch_MapRequestEvent),
+        (23, xcb.xproto.ConfigureRequestEvent, dispatch_ConfigureRequestEvent),
+        (28, xcb.xproto.PropertyNotifyEvent, dispatch_PropertyNotifyEvent),
+        (33, xcb.xproto.ClientMessageEvent, dispatch_ClientMessageEvent),
+        (34, xcb.xproto.MappingNotifyEvent, dispatch_MappingNotifyEvent)):
+    __dispatch[code] = (xevent, handler, __events[xevent])
+del code, xevent, handler
@@ -1,43 +1,116 @@
+from collections import defaultdict, OrderedDict
+
 import xcb.xproto
 
 import state
 import workspace
 
-__stack = []
+# The focus stack, from least recently focused to most recently focused.
+# Each client maps to a sequence number that only ever goes up, so that
+# any two clients can be ordered without searching the stack.
+__stack = OrderedDict()
+__seq = 0
+
+# The same thing, but split up by workspace. (Clients without a workspace,
+# like docks, are under None.) This lets us find the most recently focused
+# client on a workspace without looking at every other client.
+__workspaces = defaultdict(OrderedDict)
+
+# The client that was last given focus.
+__active = None
 
 def get_stack():
-    return __stack[:]
+    return list(__stack)
+
+def __push(client):
+    global __seq
+
+    __seq += 1
+    __stack[client] = __seq
+    __workspaces[client.workspace][client] = __seq
+
+def __top(mru):
+    # Unmapped clients (i.e., iconified) sit in the stack too, but the one
+    # we want is almost always on top.
+    for client in reversed(mru):
+        if client.mapped:
+            return client
+
+    return None
 
 def add(client):
     if client not in __stack:
-        __stack.append(client)
+        __push(client)
         return True
     return False
 
 def remove(client):
+    global __active
+
     if client in __stack:
-        __stack.remove(client)
+        del __stack[client]
+        for mru in __workspaces.itervalues():
+            mru.pop(client, None)
+
+    if __active is client:
+        __active = None
 
 def above(client):
+    """
+    Moves a client to the top of the focus stack, and returns the client that
+    was focused before it (or None).
+    """
+    global __active
+
     assert client in __stack
 
-    __stack.remove(client)
-    __stack.append(client)
+    del __stack[client]
+    __workspaces[client.workspace].pop(client, None)
+    __push(client)
+
+    previous, __active = __active, client
+
+    return previous
+
+def stacked(client):
+    """
+    Returns whether a client is in the focus stack. (Clients that can't be
+    focused never are.)
+    """
+    return client in __stack
+
+def rank(client):
+    """
+    Returns a number that is bigger for more recently focused clients. Useful
+    as a sort key.
+    """
+    return __stack.get(client, 0)
+
+def moved(client, old):
+    """
+    Tells the focus stack that a client has moved from the 'old' workspace to
+    'client.workspace'. It's considered the most recently focused client on
+    its new workspace.
+    """
+    if client not in __stack:
+        return
+
+    __workspaces[old].pop(client, None)
+    __workspaces[client.workspace][client] = __stack[client]
 
 def fallback():
-    def fallbackable(c):
-        return (c.mapped
-                and (c.workspace is None or workspace.current() == c.workspace))
-    stck = [client for client in get_stack() if fallbackable(client)]
+    candidates = [c for c in (__top(__workspaces[workspace.current()]),
+                              __top(__workspaces[None]))
+                  if c is not None]
 
     # This is *really* important. On occasion, it seems that focus can stay
     # with a destroyed window. If this happens to be the last window, and
     # there is nothing left in the focus stack, we *must* fall back to the
     # root!
-    if not stck:
+    if not candidates:
         state.root_focus()
     else:
-        client = stck[-1]
+        client = max(candidates, key=__stack.get)
 
         # If the window isn't alive, pop the stack until we get a good window
         if client.is_alive():
@@ -48,21 +121,7 @@ def fallback():
             fallback()
 
 def focused():
-    stck = [client for client in get_stack() if client.mapped]
-
-    if not stck:
-        return None
-
-    return stck[-1]
+    return __top(__stack)
 
 def focus_workspace(work):
-    def mapped_on_workspace(client):
-        return client.mapped and client.workspace is work
-
-    stck = [client for client in get_stack() if mapped_on_workspace(client)]
-
-    if not stck:
-        return None
-
-    return stck[-1]
-
+    return __top(__workspaces[work])
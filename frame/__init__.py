@@ -2,10 +2,12 @@ import xcb.xproto
 
 import xpybutil.ewmh as ewmh
 
+import config
 import state
 import events
 import window
 import focus
+import rendering
 import config.mousebind as mousebind
 
 def switch(old_frame, new_frame_cb):
@@ -37,8 +39,12 @@ class _FrameWindow(window.GeometryWindow):
     def __init__(self):
         window.GeometryWindow.__init__(self, self.id)
 
+        self.frame.pieces.append(self)
+
     def destroy(self):
         events.unregister_window(self.id)
+        rendering.forget(self.id)
+        window.forget(self.id)
         state.conn.core.DestroyWindow(self.id)
 
     def clear(self):
@@ -99,6 +105,10 @@ class _Frame(object):
         self.allowed_states = [State.Active, State.Inactive]
 
         self.client = client
+
+        # Every window in this frame, so they can be cleaned up when the
+        # frame is destroyed.
+        self.pieces = []
         self.parent = parent or Parent(self)
 
         # State variables
@@ -110,7 +120,10 @@ class _Frame(object):
                                            self.pos['client']['x'],
                                            self.pos['client']['y'])
         else:
+            # The parent is carried over from the old frame, so it's ours to
+            # clean up now.
             parent.frame = self
+            self.pieces.append(parent)
             self.client.win.configure(x=self.pos['client']['x'],
                                       y=self.pos['client']['y'])
 
@@ -245,6 +258,9 @@ class _Frame(object):
     def switch_off(self):
         pass
 
+    def title_changed(self):
+        pass
+
     def switch_on(self):
         self.render()
 
@@ -252,7 +268,7 @@ class _Frame(object):
         self.parent.map()
 
     def unmap(self):
-        state.conn.core.UnmapWindowChecked(self.parent.id).check()
+        state.conn.core.UnmapWindow(self.parent.id)
 
     def unparent(self):
         state.conn.core.ReparentWindow(self.client.win.id, state.root,
@@ -261,6 +277,13 @@ class _Frame(object):
 
     def destroy(self):
         self.unparent()
+
+        # Destroying the parent destroys every piece of the frame, so make
+        # sure the pixmaps they were painted with are released.
+        for piece in self.pieces:
+            rendering.forget(piece.id)
+            window.forget(piece.id)
+
         #state.conn.core.DestroySubwindows(self.parent.id)
         state.conn.core.DestroyWindow(self.parent.id)
 
@@ -270,6 +293,10 @@ class _Frame(object):
 import frames
 
 Full = frames.Full
+Composite = frames.Composite
 Border = frames.Border
 SlimBorder = frames.SlimBorder
 Nada = frames.Nada
+
+# The frame used for fully decorated clients
+Decorated = Composite if config.get_option('frm_composite') else Full
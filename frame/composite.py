@@ -0,0 +1,127 @@
+from functools import partial
+
+import xcb.xproto
+
+import state
+import events
+import window
+import config.mousebind as mousebind
+
+from frame import _FrameWindow
+
+class _InputWindow(_FrameWindow):
+    def __new__(cls, frame, ident, mask=0, values=None):
+        self = _FrameWindow.__new__(cls, frame)
+        self.id = window.create_input(self.frame.parent.id, mask, values or [])
+
+        self.ident = ident
+
+        return self
+
+    def __init__(self, *_):
+        _FrameWindow.__init__(self)
+
+class TitleHandle(_InputWindow):
+    def __new__(cls, frame):
+        return _InputWindow.__new__(cls, frame, 'title_bar')
+
+    def __init__(self, _):
+        _InputWindow.__init__(self)
+
+        mousebind.register('title', self, self.id)
+
+        self.map()
+
+class Handle(_InputWindow):
+    def __new__(cls, frame, ident, cursor, direction):
+        mask = xcb.xproto.CW.EventMask | xcb.xproto.CW.Cursor
+        values = [xcb.xproto.EventMask.ButtonPress |
+                    xcb.xproto.EventMask.ButtonRelease,
+                  state.cursors[cursor]]
+        self = _InputWindow.__new__(cls, frame, ident, mask, values)
+
+        self.direction = direction
+
+        return self
+
+    def __init__(self, *_):
+        _InputWindow.__init__(self)
+
+        client = self.frame.client
+
+        events.register_drag(client.cb_move_start, client.cb_move_drag,
+                             client.cb_move_end, self.id, 'Mod4-1', grab=False)
+        events.register_drag(partial(client.cb_resize_start,
+                                     direction=self.direction),
+                             client.cb_resize_drag, client.cb_resize_end,
+                             self.id, '1', grab=False)
+
+        # If this is a corner, then make sure normal resizing uses the
+        # appropriate direction.
+        if self.ident.find('_') > -1:
+            rs_start = partial(client.cb_resize_start,
+                               direction=self.direction)
+        else:
+            rs_start = client.cb_resize_start
+
+        events.register_drag(rs_start, client.cb_resize_drag,
+                             client.cb_resize_end, self.id, 'Mod4-3',
+                             grab=False)
+
+        self.map()
+
+class Button(_InputWindow):
+    def __new__(cls, frame, ident):
+        mask = xcb.xproto.CW.EventMask
+        values = [xcb.xproto.EventMask.ButtonPress |
+                  xcb.xproto.EventMask.ButtonRelease |
+                  xcb.xproto.EventMask.EnterWindow |
+                  xcb.xproto.EventMask.LeaveWindow]
+
+        return _InputWindow.__new__(cls, frame, ident, mask, values)
+
+    def __init__(self, *_):
+        _InputWindow.__init__(self)
+
+        self._secondary = set()
+
+        events.register_callback(xcb.xproto.EnterNotifyEvent,
+                                 self.cb_enter, self.id)
+        events.register_callback(xcb.xproto.LeaveNotifyEvent,
+                                 self.cb_leave, self.id)
+
+        mousebind.register('button', self, self.id)
+
+        self.map()
+
+    def variant(self):
+        if 'click' in self._secondary:
+            return 'click'
+        elif 'hover' in self._secondary:
+            return 'hover'
+        return 'normal'
+
+    def cb_action(self, e):
+        if 'hover' not in self._secondary:
+            return
+
+        self.frame.button_action(self.ident)
+
+    def cb_enter(self, e):
+        self._secondary.add('hover')
+        self.frame.paint_button(self)
+
+    def cb_leave(self, e):
+        self._secondary.discard('hover')
+        self.frame.paint_button(self)
+
+    def cb_buttonpress(self, e):
+        self._secondary.add('click')
+        self.frame.paint_button(self)
+
+    def cb_buttonrelease(self, e):
+        if 'click' not in self._secondary:
+            return
+
+        self._secondary.remove('click')
+        self.frame.paint_button(self)
@@ -1,5 +1,6 @@
 import xcb.xproto
 
+import xpybutil.util as util
 import xpybutil.ewmh as ewmh
 import xpybutil.image as image
 
@@ -20,6 +21,9 @@ from borders import LeftTop, LeftBottom, RightTop, RightBottom
 
 from full import (ButtonBG, Close, Icon, Maximize, Minimize, Restore,
                   ThinBorder, Title, TitleBar)
+from full import button_images, icon_images
+
+from composite import Button, Handle, TitleHandle
 
 class Full(_Frame):
     def __init__(self, client, parent=None):
@@ -318,7 +322,7 @@ class Full(_Frame):
 
         self.choose_maximized()
 
-        state.conn.flush()
+        state.flush()
 
     def choose_maximized(self):
         if self.client.maximized:
@@ -334,6 +338,10 @@ class Full(_Frame):
 
         self.render()
 
+    def title_changed(self):
+        self.title.set_text(self.client.win.wmname)
+        self.title.render()
+
     def switch_off(self):
         self.bottom_border.destroy()
         self.title_border.destroy()
@@ -358,6 +366,316 @@ class Full(_Frame):
         self.buttonbg.destroy()
         self.icon.destroy()
 
+class Composite(_Frame):
+    """
+    Looks just like Full, but draws its entire decoration into a single
+    pixmap that is used as the background of the parent window. The only
+    other windows are InputOnly windows where the pointer needs them: the
+    title bar (moving), the borders (cursors and resizing) and the buttons.
+    Changing state repaints one pixmap instead of every piece of the frame,
+    and resizing only touches the input windows that actually moved.
+    """
+    def __init__(self, client, parent=None):
+        # Setup some hints and options before calling the parent constructor
+
+        # Some size hints
+        self.__bw = 1
+        self.__bottom_bw = config.get_option('frm_full_bottom_brdr_sz')
+        self.__titleheight = 26
+        self.__crnr_sz = 26
+
+        self.pos = {
+            'client': {'x': self.__bw, 'y': self.__bw + self.__titleheight,
+                       'width': - (self.__bw * 2),
+                       'height': - (self.__bw + self.__bottom_bw +
+                                    self.__titleheight + 1)},
+            'icon': {'x': self.__bw + 3, 'y': self.__bw + 3,
+                     'width': 20, 'height': 20},
+            'title': {'x': self.__crnr_sz, 'y': self.__bw + 5,
+                      'width': 800, 'height': 20},
+            'close': {'x': -22, 'y': self.__bw + 4,
+                      'width': 17, 'height': 17},
+            'maximize': {'x': -44, 'y': self.__bw + 4,
+                         'width': 17, 'height': 17},
+            'minimize': {'x': -66, 'y': self.__bw + 4,
+                         'width': 17, 'height': 17},
+        }
+
+        # Some colors...
+        self.colors = {
+            State.Active: { # active
+                'bg': config.get_option('frm_full_bg_a'),
+                'title': config.get_option('frm_full_title_a'),
+                'thinborder': config.get_option('frm_thinborder_clr'),
+                'bottomborder': config.get_option('frm_full_bottom_brdr_a'),
+                'buttonbg': config.get_option('frm_full_button_bg_a'),
+                'buttonfg': config.get_option('frm_full_button_fg_a')
+            },
+            State.Inactive: { # inactive
+                'bg': config.get_option('frm_full_bg_i'),
+                'title': config.get_option('frm_full_title_i'),
+                'thinborder': config.get_option('frm_thinborder_clr'),
+                'bottomborder': config.get_option('frm_full_bottom_brdr_i'),
+                'buttonbg': config.get_option('frm_full_button_bg_i'),
+                'buttonfg': config.get_option('frm_full_button_fg_i')
+            }
+        }
+
+        # Set the sizes of each side
+        self.top = self.pos['client']['y']
+        self.left = self.__bw
+        self.right = self.__bw
+        self.bottom = self.__bottom_bw + 1
+
+        _Frame.__init__(self, client, parent)
+
+        # The decoration pixmap, and the pixmaps that it is composed from.
+        # The latter are keyed by image data, with (pixmap, width, height)
+        # values.
+        self._pix = None
+        self._pixmaps = {}
+        self._rects = {}
+
+        self._imgs = {
+            'icon': icon_images(self, self.pos['icon']['width'],
+                                self.pos['icon']['height']),
+            'close': button_images(self, rendering.close, 17, 17),
+            'maximize': button_images(self, rendering.maximize, 17, 17),
+            'restore': button_images(self, rendering.restore, 17, 17),
+            'minimize': button_images(self, rendering.minimize, 17, 17),
+            'title': {},
+        }
+        self.set_title(self.client.win.wmname)
+
+        # Stacking order matters: the borders go above the title bar, and the
+        # buttons go above everything.
+        mr = ewmh.MoveResize
+        self.title_bar = TitleHandle(self)
+        self.handles = [
+            Handle(self, 'top', 'TopSide', mr.SizeTop),
+            Handle(self, 'top_left', 'TopLeftCorner', mr.SizeTopLeft),
+            Handle(self, 'top_right', 'TopRightCorner', mr.SizeTopRight),
+            Handle(self, 'bottom', 'BottomSide', mr.SizeBottom),
+            Handle(self, 'bottom_left', 'BottomLeftCorner',
+                   mr.SizeBottomLeft),
+            Handle(self, 'bottom_right', 'BottomRightCorner',
+                   mr.SizeBottomRight),
+            Handle(self, 'left', 'LeftSide', mr.SizeLeft),
+            Handle(self, 'right', 'RightSide', mr.SizeRight),
+        ]
+        self.buttons = [Button(self, 'close'), Button(self, 'maximize'),
+                        Button(self, 'minimize')]
+
+        self.configure_client(width=self.client.win.geom['width'],
+                              height=self.client.win.geom['height'])
+
+    def title_changed(self):
+        self.set_title(self.client.win.wmname)
+        self.render()
+
+    def set_title(self, txt):
+        if not len(txt):
+            txt = ' ' # Dirty hack. I guess PIL can't handle empty strings
+
+        font_file = config.get_option('frm_full_font')
+        font_size = config.get_option('frm_full_font_sz')
+
+        for st in self.allowed_states:
+            old = self._imgs['title'].get(st)
+            self._imgs['title'][st] = rendering.text_data(
+                font_file, font_size, txt,
+                self.colors[st]['bg'], self.colors[st]['title'],
+                self.pos['title']['width'], self.pos['title']['height'])
+
+            if old is not None and old[0] in self._pixmaps:
+                rendering.release_pix(*old)
+                del self._pixmaps[old[0]]
+
+    def configure(self, x=None, y=None, width=None, height=None,
+                  border_width=None, sibling=None, stack_mode=None,
+                  ignore_hints=False):
+        (x, y, width, height,
+         border_width, sibling, stack_mode) = _Frame.configure(
+            self, x, y, width, height, border_width, sibling, stack_mode,
+            ignore_hints)
+
+        if width or height:
+            self._place_inputs()
+            self.compose()
+
+    def _input_rects(self, w, h):
+        bw, c = self.__bw, self.__crnr_sz
+        bbw, th = self.__bottom_bw, self.__titleheight
+        bx = w + self.pos['minimize']['x']
+
+        # Frames smaller than the corners squeeze the sides down to nothing
+        sw, sh = max(1, w - 2 * c), max(1, h - 5 - bbw)
+
+        rects = {
+            'title_bar': (0, 0, max(1, bx), th),
+            'top': (c, 0, sw, 5),
+            'top_left': (0, 0, c, 5),
+            'top_right': (w - c, 0, c, 5),
+            'bottom': (c, h - bbw, sw, bbw),
+            'bottom_left': (0, h - bbw, c, bbw),
+            'bottom_right': (w - c, h - bbw, c, bbw),
+            'left': (0, 5, bw, sh),
+            'right': (w - bw, 5, bw, sh),
+        }
+        for ident in ('close', 'maximize', 'minimize'):
+            p = self.pos[ident]
+            rects[ident] = (w + p['x'], p['y'], p['width'], p['height'])
+
+        return rects
+
+    def _place_inputs(self):
+        rects = self._input_rects(self.parent.geom['width'],
+                                  self.parent.geom['height'])
+
+        for win in [self.title_bar] + self.handles + self.buttons:
+            rect = rects[win.ident]
+            if self._rects.get(win.ident) == rect:
+                continue
+
+            self._rects[win.ident] = rect
+            win.configure(x=rect[0], y=rect[1], width=rect[2], height=rect[3])
+
+    def _pixmap(self, img):
+        data, w, h = img
+        if data not in self._pixmaps:
+            self._pixmaps[data] = (rendering.acquire_pix(data, w, h), w, h)
+
+        return self._pixmaps[data][0]
+
+    def _button_img(self, button):
+        ident = button.ident
+        if ident == 'maximize' and self.client.maximized:
+            ident = 'restore'
+
+        p = self.pos[button.ident]
+        data = self._imgs[ident][self.state][button.variant()]
+
+        return data, p['width'], p['height']
+
+    def _draw_button(self, button):
+        x, y, w, h = self._rects[button.ident]
+        rendering.copy_pix(self._pixmap(self._button_img(button)), self._pix,
+                           x, y, w, h)
+
+        return x, y, w, h
+
+    def compose(self):
+        w, h = self.parent.geom['width'], self.parent.geom['height']
+        if w <= 0 or h <= 0:
+            return
+
+        colors = self.colors[self.state]
+        bbw, th = self.__bottom_bw, self.__titleheight
+
+        old = self._pix
+        self._pix = state.conn.generate_id()
+        state.conn.core.CreatePixmap(state.rsetup.root_depth, self._pix,
+                                     self.parent.id, w, h)
+
+        rendering.fill(self._pix, colors['bg'], [(0, 0, w, h)])
+        rendering.fill(self._pix, colors['bottomborder'],
+                       [(0, h - bbw, w, bbw)])
+        rendering.fill(self._pix, colors['thinborder'],
+                       [(0, 0, w, 1), (0, h - 1, w, 1), (0, 0, 1, h),
+                        (w - 1, 0, 1, h), (0, th, w, 1),
+                        (0, h - bbw - 1, w, 1)])
+
+        p = self.pos['icon']
+        icon = (self._imgs['icon'][self.state], p['width'], p['height'])
+        rendering.copy_pix(self._pixmap(icon), self._pix, p['x'], p['y'],
+                           p['width'], p['height'])
+
+        # The title is clipped so that it doesn't run into the buttons
+        p = self.pos['title']
+        title = self._imgs['title'][self.state]
+        tw = min(title[1], w + self.pos['minimize']['x'] - p['x'])
+        if tw > 0:
+            rendering.copy_pix(self._pixmap(title), self._pix, p['x'], p['y'],
+                               tw, title[2])
+
+        for button in self.buttons:
+            self._draw_button(button)
+
+        self._show_pix()
+
+        if old is not None:
+            state.conn.core.FreePixmap(old)
+
+    def _show_pix(self):
+        state.conn.core.ChangeWindowAttributes(self.parent.id,
+                                               xcb.xproto.CW.BackPixmap,
+                                               [self._pix])
+        self.parent.clear()
+
+    def map(self):
+        _Frame.map(self)
+
+        # Mapping the parent paints it with its plain border color, so the
+        # decorations have to be put back.
+        if self._pix is not None:
+            self._show_pix()
+
+    def paint_button(self, button):
+        if self._pix is None:
+            return
+
+        x, y, w, h = self._draw_button(button)
+        state.conn.core.ClearArea(0, self.parent.id, x, y, w, h)
+
+    def button_action(self, ident):
+        if ident == 'close':
+            self.client.close()
+        elif ident == 'minimize':
+            self.client.minimize()
+        elif ident == 'maximize':
+            self.client.maximized = not self.client.maximized
+
+            # I shouldn't need this here in the future, since the process of
+            # *actually* maximizing a window should render the frame.
+            self.render()
+
+    def render(self):
+        if not _Frame.render(self):
+            return
+
+        self.compose()
+
+        state.flush()
+
+    def set_state(self, st):
+        if not _Frame.set_state(self, st):
+            return
+
+        self.render()
+
+    def _release(self):
+        for data, (_, w, h) in self._pixmaps.iteritems():
+            rendering.release_pix(data, w, h)
+        self._pixmaps = {}
+
+        if self._pix is not None:
+            state.conn.core.FreePixmap(self._pix)
+            self._pix = None
+
+    def switch_off(self):
+        self._release()
+
+        for button in self.buttons:
+            button.destroy()
+        for handle in self.handles:
+            handle.destroy()
+        self.title_bar.destroy()
+
+    def destroy(self):
+        self._release()
+
+        _Frame.destroy(self)
+
 class Border(_Frame):
     def __init__(self, client, parent=None):
         # Setup some hints and options before calling the parent constructor
@@ -550,7 +868,7 @@ class Border(_Frame):
         self.right_top.render()
         self.right_bottom.render()
         self.parent.render()
-        state.conn.flush()
+        state.flush()
 
     def set_state(self, st):
         if not _Frame.set_state(self, st):
@@ -610,7 +928,7 @@ class SlimBorder(_Frame):
             return
 
         self.parent.render()
-        state.conn.flush()
+        state.flush()
 
     # No state changing necessary...
     def set_state(self, st):
@@ -6,6 +6,7 @@ import xpybutil.util as util
 import xpybutil.ewmh as ewmh
 import xpybutil.image as image
 
+import config
 import state
 import events
 import window
@@ -38,40 +39,24 @@ class Title(_FrameWindow):
         self.configure(x=self.pos['x'], y=self.pos['y'],
                        height=self.pos['height'])
 
-        events.register_callback(xcb.xproto.PropertyNotifyEvent,
-                                 self.cb_PropertyNotifyEvent,
-                                 self.frame.client.win.id)
-
         mousebind.register('title', self, self.id)
 
         self.set_text(self.frame.client.win.wmname)
 
         self.map()
 
-    # I'll probably scrub this in favor of a hook "name change"
-    # There's too much reliance on 'client.win.wmname' being updated before
-    def cb_PropertyNotifyEvent(self, e):
-        prop = util.get_atom_name(state.conn, e.atom)
-        if prop in ('_NET_WM_NAME', 'WM_NAME'):
-            self.set_text(self.frame.client.win.wmname)
-            self.render()
-
     def set_text(self, txt):
         if not len(txt):
             txt = ' ' # Dirty hack. I guess PIL can't handle empty strings
 
-        font_file = '/usr/share/fonts/TTF/DejaVuSans-Bold.ttf'
-        font = rendering.create_font(font_file, 15)
+        font_file = config.get_option('frm_full_font')
+        font_size = config.get_option('frm_full_font_sz')
 
         for st in self._imgs:
-            im = rendering.draw_text_bgcolor(font, txt,
-                                             self.frame.colors[st]['bg'],
-                                             self.frame.colors[st]['title'],
-                                             self.pos['width'],
-                                             self.pos['height'])
-
-            width, height = im.size
-            self._imgs[st] = image.get_data(im)
+            self._imgs[st], width, height = rendering.text_data(
+                font_file, font_size, txt,
+                self.frame.colors[st]['bg'], self.frame.colors[st]['title'],
+                self.pos['width'], self.pos['height'])
 
         self._fwidth, self._fheight = width, height
 
@@ -248,39 +233,8 @@ class _WindowButton(_FrameWindow):
         self.render()
 
     def setup(self):
-        for st in self._imgs:
-            w, h = self.pos['width'], self.pos['height']
-            x = (w - self._img_source.size[0]) / 2
-            y = (h - self._img_source.size[1]) / 2
-
-            buttonbg = image.hex_to_rgb(self.frame.colors[st]['buttonbg'])
-            buttonfg = image.hex_to_rgb(self.frame.colors[st]['buttonfg'])
-
-            # Create the "base" image
-            normal = Image.new('RGBA', (w, h), color=buttonbg)
-            normal.paste(self._img_source, box=(x, y), mask=self._img_source)
-
-            imgd = ImageDraw.Draw(normal)
-            imgd.bitmap((x, y), self._img_source, fill=buttonfg)
-
-            # Make other two states before beveling
-            hover = normal.copy()
-            click = normal.copy()
-
-            # Now add effects that differentiate the states
-            rendering.bevel_up(normal)
-
-            bright = ImageEnhance.Brightness(click)
-            click = bright.enhance(1.2)
-            rendering.bevel_down(click)
-
-            bright = ImageEnhance.Brightness(hover)
-            hover = bright.enhance(1.2)
-            rendering.bevel_up(hover)
-
-            self._imgs[st]['normal'] = image.get_data(normal)
-            self._imgs[st]['click'] = image.get_data(click)
-            self._imgs[st]['hover'] = image.get_data(hover)
+        self._imgs = button_images(self.frame, self._img_source,
+                                   self.pos['width'], self.pos['height'])
 
     def render(self):
         imgs = self._imgs[self.frame.state]
@@ -390,36 +344,85 @@ class Icon(_FrameWindow):
         self.map()
 
     def setup(self):
-        icon = self.frame.client.win.get_icon(self.pos['width'],
-                                              self.pos['height'])
-
-        # If for some reason we couldn't get an icon...
-        if icon is None or not icon['width'] or not icon['height']:
-            for st in self._imgs:
-                self._imgs[st] = rendering.box(self.frame.colors[st]['bg'],
-                                               self.pos['width'],
-                                               self.pos['height'])
-
-            return
-
-        # Blending time... yuck
-        im = image.get_image(icon['width'], icon['height'], icon['data'])
-        im = im.resize((self.pos['width'], self.pos['height']))
-
-        if 'mask' in icon and icon['mask'] and icon['mask'] != icon['data']:
-            immask = image.get_bitmap(icon['width'], icon['height'],
-                                      icon['mask'])
-            immask = immask.resize((self.pos['width'], self.pos['height']))
-        else:
-            immask = im.copy()
-
-        for st in self._imgs:
-            im = rendering.blend(im, immask, self.frame.colors[st]['bg'],
-                                 self.pos['width'], self.pos['height'])
-
-            self._imgs[st] = image.get_data(im)
+        self._imgs = icon_images(self.frame, self.pos['width'],
+                                 self.pos['height'])
 
     def render(self):
         rendering.paint_pix(self.id, self._imgs[self.frame.state],
                             self.pos['width'], self.pos['height'])
 
+def button_images(frame, img_source, w, h):
+    """
+    Returns the raw image data of a button, for each state of 'frame', in
+    each of its 'normal', 'hover' and 'click' variations.
+    """
+    imgs = {}
+    for st in frame.allowed_states:
+        x = (w - img_source.size[0]) / 2
+        y = (h - img_source.size[1]) / 2
+
+        buttonbg = image.hex_to_rgb(frame.colors[st]['buttonbg'])
+        buttonfg = image.hex_to_rgb(frame.colors[st]['buttonfg'])
+
+        # Create the "base" image
+        normal = Image.new('RGBA', (w, h), color=buttonbg)
+        normal.paste(img_source, box=(x, y), mask=img_source)
+
+        imgd = ImageDraw.Draw(normal)
+        imgd.bitmap((x, y), img_source, fill=buttonfg)
+
+        # Make other two states before beveling
+        hover = normal.copy()
+        click = normal.copy()
+
+        # Now add effects that differentiate the states
+        rendering.bevel_up(normal)
+
+        bright = ImageEnhance.Brightness(click)
+        click = bright.enhance(1.2)
+        rendering.bevel_down(click)
+
+        bright = ImageEnhance.Brightness(hover)
+        hover = bright.enhance(1.2)
+        rendering.bevel_up(hover)
+
+        imgs[st] = {'normal': image.get_data(normal),
+                    'click': image.get_data(click),
+                    'hover': image.get_data(hover)}
+
+    return imgs
+
+def icon_images(frame, width, height):
+    """
+    Returns the raw image data of the client's icon, blended with the
+    background color of each state of 'frame'.
+    """
+    imgs = {}
+    icon = frame.client.win.get_icon(width, height)
+
+    # If for some reason we couldn't get an icon...
+    if icon is None or not icon['width'] or not icon['height']:
+        for st in frame.allowed_states:
+            imgs[st] = image.get_data(rendering.box(frame.colors[st]['bg'],
+                                                    width, height))
+
+        return imgs
+
+    # Blending time... yuck
+    im = image.get_image(icon['width'], icon['height'], icon['data'])
+    im = im.resize((width, height))
+
+    if 'mask' in icon and icon['mask'] and icon['mask'] != icon['data']:
+        immask = image.get_bitmap(icon['width'], icon['height'],
+                                  icon['mask'])
+        immask = immask.resize((width, height))
+    else:
+        immask = im.copy()
+
+    for st in frame.allowed_states:
+        im = rendering.blend(im, immask, frame.colors[st]['bg'],
+                             width, height)
+
+        imgs[st] = image.get_data(im)
+
+    return imgs
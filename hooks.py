@@ -7,6 +7,9 @@ __hooks = {
     'client_unmapped': [],
     'client_iconified': [],
     'client_deiconified': [],
+    'client_icon_changed': [],
+    'x_error': [],
+    'ungrab': [],
 }
 
 def attach(hook, fun):
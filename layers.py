@@ -1,6 +1,8 @@
 import xcb.xproto
 
 import state
+import events
+import hooks
 
 class Layer(object):
     __layers = []
@@ -17,39 +19,28 @@ class Layer(object):
     def __init__(self):
         """Starts the stack and adds itself to the list of layers."""
         self.__stack = []
+        self.__index = len(Layer.__layers)
 
         Layer.__layers.append(self)
 
     def get_bottom_sibling(self):
-        """Fetches the top-most window of the layer beneath this layer."""
-        ind = Layer.__layers.index(self)
+        """Fetches the top-most window of the layers beneath this layer."""
+        # No windows in a layer... move to the next one down
+        for layer in reversed(Layer.__layers[:self.__index]):
+            top = layer.top()
+            if top is not None:
+                return top
 
         # Bottom layer has no bottom sibling
-        # (Also our base case.)
-        if not ind:
-            return None
-
-        beneath = Layer.__layers[ind - 1]
-
-        # No windows in this layer... move to the next
-        if not len(beneath):
-            return beneath.get_bottom_sibling()
-
-        # Return the top most window...
-        return beneath.top()
+        return None
 
     def get_top_sibling(self):
         """Fetches the top-most window of the current layer."""
-        if not len(self):
-            ind = Layer.__layers.index(self)
+        top = self.top()
+        if top is None:
+            return self.get_bottom_sibling()
 
-            # Base case
-            if not ind:
-                return None
-            else:
-                return Layer.__layers[ind - 1].get_top_sibling()
-        else:
-            return self.top()
+        return top
 
     def stack(self):
         """Stack the windows. Lowest windows first."""
@@ -64,6 +55,12 @@ class Layer(object):
 
             sibling = client
 
+    @staticmethod
+    def stack_all():
+        """Stacks every layer from scratch, bottom layer first."""
+        for layer in Layer.__layers:
+            layer.stack()
+
     def above(self, win):
         """Moves a window to the top of this layer."""
         assert win in self
@@ -78,6 +75,48 @@ class Layer(object):
         self.__stack.remove(win)
         self.__stack.insert(0, win)
 
+    def raise_window(self, win):
+        """
+        Moves a window to the top of this layer, and restacks only that
+        window: it's put right above the top-most visible window beneath it.
+        Everything else is assumed to be stacked correctly already, so this
+        is a single request no matter how many windows there are. (If a
+        restack fails, everything is stacked again from scratch. See
+        '__restack_failed'.)
+        """
+        sibling = self.top(exclude=win)
+        if sibling is None:
+            sibling = self.get_bottom_sibling()
+
+        self.above(win)
+
+        if sibling is None:
+            win.configure(stack_mode=xcb.xproto.StackMode.Below)
+        else:
+            win.configure(sibling=sibling.parent_id(),
+                          stack_mode=xcb.xproto.StackMode.Above)
+
+    def lower_window(self, win):
+        """
+        Moves a window to the bottom of this layer. Like 'raise_window', only
+        the window being moved is restacked.
+        """
+        sibling = self.bottom(exclude=win)
+
+        self.below(win)
+
+        if sibling is not None:
+            win.configure(sibling=sibling.parent_id(),
+                          stack_mode=xcb.xproto.StackMode.Below)
+            return
+
+        sibling = self.get_bottom_sibling()
+        if sibling is None:
+            win.configure(stack_mode=xcb.xproto.StackMode.Below)
+        else:
+            win.configure(sibling=sibling.parent_id(),
+                          stack_mode=xcb.xproto.StackMode.Above)
+
     def add(self, win):
         """
         Adds a window to the top of this layer.
@@ -107,9 +146,27 @@ class Layer(object):
 
         return self
 
-    def top(self):
-        """Returns the top most window in this layer."""
-        return self.visible()[-1]
+    def top(self, exclude=None):
+        """
+        Returns the top most visible window in this layer, or None if there
+        isn't one.
+        """
+        for client in reversed(self.__stack):
+            if client.mapped and client is not exclude:
+                return client
+
+        return None
+
+    def bottom(self, exclude=None):
+        """
+        Returns the bottom most visible window in this layer, or None if there
+        isn't one.
+        """
+        for client in self.__stack:
+            if client.mapped and client is not exclude:
+                return client
+
+        return None
 
     def visible(self):
         return [client for client in self.__stack if client.mapped]
@@ -120,6 +177,22 @@ class Layer(object):
     def __contains__(self, item):
         return item in self.__stack
 
+def __restack_failed(error, name, args):
+    # 'raise_window' and 'lower_window' only restack the window that moved,
+    # relative to a neighbour, so they're only right as long as the server
+    # stacks windows exactly the way the layers say it does. If a restack
+    # fails (say, the sibling was destroyed before we heard about it), that
+    # stops being true, so stack everything again once the current batch of
+    # events is done.
+    if name != 'configure':
+        return
+
+    wid, mask, values = args
+    if mask & xcb.xproto.ConfigWindow.StackMode:
+        events.register_latent_callback(Layer.stack_all)
+
+hooks.attach('x_error', __restack_failed)
+
 # The first layer declared is the bottom layer,
 # and the last layer declared is the top layer.
 desktop = Layer()
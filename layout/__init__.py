@@ -5,6 +5,7 @@ import frame
 class Layout(object):
     def __init__(self, workspace):
         self._windows = {}
+        self._clients = {}
         self._workspace = workspace
 
     def place(self, client=None):
@@ -22,11 +23,13 @@ class Layout(object):
         self._windows[client.win.id] = {
             'x': None, 'y': None, 'width': None, 'height': None,
         }
+        self._clients[client.win.id] = client
 
     def remove(self, client):
         assert client.win.id in self._windows
 
         del self._windows[client.win.id]
+        del self._clients[client.win.id]
 
     def remove_one(self, client):
         assert False, 'subclass responsibility'
@@ -61,10 +64,15 @@ class Layout(object):
             self.restore(client)
 
     def clients(self):
-        for client in focus.get_stack():
-            if client.workspace == self.workspace and not client.iconified:
-                if client.layout() == self:
-                    yield client
+        """
+        Returns the clients that this layout is currently in charge of, from
+        least recently focused to most recently focused. Only clients in the
+        focus stack count.
+        """
+        return sorted([client for client in self._clients.itervalues()
+                       if focus.stacked(client) and not client.iconified
+                          and client.layout() is self],
+                      key=focus.rank)
 
     def focus_up(self): pass
     def focus_down(self): pass
@@ -118,8 +126,34 @@ class TileBox(object):
         self.children = []
         self.proportion = 1.0
 
+        # The rectangle from the last 'moveresize'. If it doesn't change and
+        # nothing below this box changed either, there's nothing to do.
         self.x = self.y = 0
         self.w = self.h = 1
+        self.dirty = True
+
+    @property
+    def proportion(self):
+        return self._proportion
+
+    @proportion.setter
+    def proportion(self, value):
+        self._proportion = value
+
+        # The parent has to hand out new rectangles to its children
+        if self.parent is not None:
+            self.parent.mark_dirty()
+
+    def mark_dirty(self):
+        """
+        Makes the next 'moveresize' lay out this box again, even if its
+        rectangle is the same. Everything above it is marked too, since that's
+        the only way to get here.
+        """
+        box = self
+        while box is not None:
+            box.dirty = True
+            box = box.parent
 
     def childs(self):
         for child in self.children:
@@ -140,12 +174,14 @@ class TileBox(object):
             self.children.append(box)
 
         box.parent = self
+        box.mark_dirty()
 
     def remove_child(self, box):
         assert isinstance(box, TileBox) and box in self.children
 
         self.children.remove(box)
         box.parent = None
+        self.mark_dirty()
 
         if self.children:
             add = box.proportion / len(self.children)
@@ -171,9 +207,14 @@ class TileBox(object):
 
         find.parent = None
         replace.parent = self
+        replace.mark_dirty()
 
     def moveresize(self, x, y, w, h):
+        if not self.dirty and (x, y, w, h) == (self.x, self.y, self.w, self.h):
+            return
+
         self._moveresize(x, y, w, h)
+        self.dirty = False
 
     def _moveresize(self, x, y, w, h):
         self.x, self.y, self.w, self.h = x, y, w, h
@@ -211,15 +252,18 @@ class TileRoot(TileBox):
     def add_child(self, box):
         self.child = box
         self.child.proportion = 1.0
+        self.mark_dirty()
 
     def remove_child(self):
         self.child = None
+        self.mark_dirty()
 
     def replace_child(self, find, replace):
         assert (isinstance(find, TileBox) and isinstance(replace, TileBox)
                 and find == self.child)
 
         self.child = replace
+        replace.mark_dirty()
 
     def activate(self):
         state.root_focus()
@@ -252,6 +296,10 @@ class TileLeaf(TileBox):
         self.cyc_ind = 0
         self.hidden = []
 
+        # The frame we last configured. It changes when the client is
+        # switched to another frame, and the new one needs configuring.
+        self._frame = None
+
     def childs(self):
         yield self
 
@@ -270,6 +318,9 @@ class TileLeaf(TileBox):
     def switch(self, leaf):
         self.client, leaf.client = leaf.client, self.client
 
+        self.mark_dirty()
+        leaf.mark_dirty()
+
     def leaf_direction(self, direction, shallow=False):
         assert direction in ('up', 'right', 'down', 'left')
 
@@ -341,12 +392,27 @@ class TileLeaf(TileBox):
             parent.add_child(leaf)
             parent.add_child(self)
 
+        return leaf
+
+    def check_frame(self):
+        """
+        Marks this leaf dirty if its client's frame isn't where we last put
+        it: either the client was switched to another frame, or it moved
+        itself with a ConfigureRequest.
+        """
+        frm = self.client.frame
+        geom = frm.parent.geom
+        if (frm is not self._frame
+            or (geom['x'], geom['y'], geom['width'], geom['height'])
+               != (self.x, self.y, self.w, self.h)):
+            self.mark_dirty()
+
     def _moveresize(self, x, y, w, h):
         TileBox._moveresize(self, x, y, w, h)
 
+        self._frame = self.client.frame
         self.client.frame.configure(x=x, y=y, width=w, height=h, 
                                     ignore_hints=True)
-        self.client.stack_raise()
 
     def _find_like_parent(self, cls, no_child_index):
         child = self
@@ -434,7 +500,7 @@ class TileHorizontalBox(TileBox):
 
         s_x = x
         for i, child in enumerate(self.children):
-            child._moveresize(s_x, y, widths[i], h)
+            child.moveresize(s_x, y, widths[i], h)
             s_x += widths[i]
 
     def _string(self):
@@ -509,7 +575,7 @@ class TileVerticalBox(TileBox):
 
         s_y = y
         for i, child in enumerate(self.children):
-            child._moveresize(x, s_y, w, heights[i])
+            child.moveresize(x, s_y, w, heights[i])
             s_y += heights[i]
 
     def _string(self):
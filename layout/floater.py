@@ -1,8 +1,9 @@
 import xpybutil.ewmh as ewmh
 
+import config
 import state
 
-from layout import Layout, tilers
+from layout import Layout, tilers, placement
 import frame
 
 class FloatLayout(Layout): 
@@ -38,82 +39,42 @@ class FloatLayout(Layout):
 
     def place(self, client=None):
         if client is not None:
-            client.configure(**self._try_nonoverlapping_xy(client))
+            client.configure(**self._placement(client))
 
-    def _try_nonoverlapping_xy(self, client):
+    def _placement(self, client):
         """
-        Retrieves an x,y position such that the given client can be positioned
-        without overlapping another window. If no such x,y position exists,
-        return 0,0.
-
-        Algorithm:
-        - Keep a list of rectangles that represent uncovered space. Initialize 
-          it to the entire area.
-        - For each of the given rectangles
-          - For each rectangle in uncovered space
-            - If they intersect, divide the uncovered space into smaller
-              rectangles around the covering rectangle, and add the smaller
-              rectangles (if any) to your list of uncovered ones.
-        - If your list of uncovered space still has any entries, they contain
-          all points not covered by the given rectangles.
-
-        Source: http://stackoverflow.com/questions/3859010/efficient-algorithm-to-find-a-point-not-touched-by-a-set-of-rectangles/3859667#3859667
-
-        XXX: It might be a good idea to prematurely return 0,0 if there are
-             more than N number of windows in this layout.
+        Picks a position for a new client with the strategy set in the
+        'float_placement' option: 'smart' (the top left most spot where the
+        client doesn't overlap anything, or the top left of the workarea if
+        there is no such spot), 'cascade', 'center' or 'under_mouse'.
         """
-
-        def empty_rect((x, y, w, h)):
-            return w <= 0 or h <= 0
-
-        def rect_subtract((r1x1, r1y1, r1w, r1h), (r2x1, r2y1, r2w, r2h)):
-            r1x2, r1y2 = r1x1 + r1w, r1y1 + r1h
-            r2x2, r2y2 = r2x1 + r2w, r2y1 + r2h
-            
-            # No intersection, return the free area back
-            if r2x1 >= r1x2 or r1x1 >= r2x2 or r2y1 >= r1y2 or r1y1 >= r2y2:
-                return [(r1x1, r1y1, r1w, r1h)]
-
-            # "r2 >= r1" => no free rectangles
-            if r1x1 >= r2x1 and r1y1 >= r2y1 and r1x2 <= r2x2 and r1y2 <= r2y2:
-                return []
-
-            # I think this is "write once, read never" code...
-            # All it's doing is subtracting r2 from r1---which could yield
-            # up to 4 new rectangles (or no rectangles); hence the filter...
-            return filter(lambda rect: not empty_rect(rect),
-                          [(r1x1, r1y1, r1w, r2y1 - r1y1),
-                           (r1x1, r1y1, r2x1 - r1x1, r1h),
-                           (r1x1, r2y2, r1w, r1h - ((r2y1 - r1y1) + r2h)),
-                           (r2x2, r1y1, r1w - ((r2x1 - r1x1) + r2w), r1h)])
-
-        def get_empty_rects():
-            empty = [(wa['x'], wa['y'], wa['width'], wa['height'])]
-
+        wa = self.workspace.workarea
+        wa = (wa['x'], wa['y'], wa['width'], wa['height'])
+        cgeom = client.frame.parent.geom
+        w, h = cgeom['width'], cgeom['height']
+
+        strategy = config.get_option('float_placement')
+        if strategy == 'center':
+            x, y = placement.center(wa, w, h)
+        elif strategy == 'under_mouse':
+            qp = state.core.QueryPointer(state.root).reply()
+            x, y = placement.under_mouse(wa, w, h, qp.root_x, qp.root_y)
+        else:
+            rects = []
             for c in self.clients():
-                if c == client:
+                if c is client:
                     continue
 
                 geom = c.frame.parent.geom
-                clientrect = (geom['x'], geom['y'], 
-                              geom['width'], geom['height'])
-                for i, rect in enumerate(empty[:]):
-                    empty.remove(rect)
-                    empty += rect_subtract(rect, clientrect)
+                rects.append((geom['x'], geom['y'],
+                              geom['width'], geom['height']))
 
-            return empty
+            if strategy == 'cascade':
+                x, y = placement.cascade(wa, rects, w, h)
+            else:
+                x, y = placement.smart(wa, rects, w, h) or wa[:2]
 
-        wa = self.workspace.workarea
-        cgeom = client.frame.parent.geom
-        rects_fit_client = (lambda (x, y, w, h):
-                                w >= cgeom['width'] and h >= cgeom['height'])
-        empty = filter(rects_fit_client, get_empty_rects())
-        
-        if empty:
-            empty = sorted(empty, key=lambda (x, y, w, h): (y, x)) # By y then x
-            return { 'x': empty[0][0], 'y': empty[0][1] }
-        else:
-            return { 'x': wa['x'], 'y': wa['y'] }
+        return { 'x': x, 'y': y }
 
     def resize_start(self, client, root_x, root_y, event_x, event_y,
                      direction=None):
@@ -245,13 +206,13 @@ class FloatLayout(Layout):
     def move_drag(self, client, root_x, root_y):
         cont = client.frame.parent # shortcut
 
-        cont.geom['x'] += root_x - self._moving['root_x']
-        cont.geom['y'] += root_y - self._moving['root_y']
+        x = cont.geom['x'] + root_x - self._moving['root_x']
+        y = cont.geom['y'] + root_y - self._moving['root_y']
 
         self._moving['root_x'] = root_x
         self._moving['root_y'] = root_y
 
-        client.frame.configure(x=cont.geom['x'], y=cont.geom['y'])
+        client.frame.configure(x=x, y=y)
 
     def move_end(self, client, root_x, root_y):
         self._moving = None
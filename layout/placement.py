@@ -0,0 +1,177 @@
+"""
+Strategies for picking a position for a new floating window.
+
+Each strategy takes the workarea and the size of the window being placed
+(and possibly some more), and returns an (x, y) tuple. Rectangles are
+always (x, y, width, height) tuples.
+"""
+
+# How far apart cascaded windows are.
+cascade_step = 30
+
+def smart(wa, rects, width, height):
+    """
+    Returns the top-most (then left-most) position in the workarea where a
+    window of the given size doesn't overlap any of 'rects', or None if
+    there is no such position.
+
+    A window that fits somewhere can always be slid up until it hits the
+    top of the workarea or the bottom of another window. So only those y
+    positions are tried, from the top down. For each one, the windows that
+    cross the horizontal band the new window would cover are sorted by x,
+    and the first gap that is wide enough wins.
+
+    That's O(n log n) per y position, which adds up to O(n**2 log n) when
+    the workarea is already full and every position has to be tried. So
+    positions are ruled out first with bit masks of where the window could
+    go in each row of the workarea (see '__occupancy'), which takes linear
+    time. When the workarea is full, that's usually enough to give up
+    without trying any position at all.
+    """
+    wx, wy, ww, wh = wa
+    if ww < width or wh < height:
+        return None
+
+    ch, rows = __occupancy(wa, rects, width, height)
+
+    # The first grid row that the window would cover completely needs room
+    # for it, or there's no point in looking any closer.
+    first = set([r for r, free in enumerate(rows) if free])
+    if not first:
+        return None
+
+    ys = set([wy])
+    ys.update([ry + rh for _, ry, _, rh in rects
+               if wy < ry + rh <= wy + wh - height])
+    ys = [y for y in ys if (y - wy + ch - 1) // ch in first]
+    if not ys:
+        return None
+
+    rects = sorted(rects, key=lambda (x, y, w, h): y)
+    for y in sorted(ys):
+        y2 = y + height
+
+        # In fact, every row it would cover completely needs room for it in
+        # the same place.
+        free = -1
+        for r in xrange((y - wy + ch - 1) // ch, (y2 - wy) // ch):
+            free &= rows[r]
+        if not free:
+            continue
+
+        spans = []
+        for rx, ry, rw, rh in rects:
+            if ry >= y2:
+                break
+            if ry + rh > y:
+                spans.append((rx, rx + rw))
+        spans.sort()
+
+        x = wx
+        for sx, sx2 in spans:
+            if sx - x >= width:
+                break
+            x = max(x, sx2)
+
+        if x + width <= wx + ww:
+            return x, y
+
+    return None
+
+def __occupancy(wa, rects, width, height):
+    """
+    Splits the workarea into rows that are about half as tall as the window
+    being placed. For each row, returns a bit mask where bit i is set if a
+    window of the given width at x = wa.x + i wouldn't touch any rectangle
+    that crosses that row. The row height is returned too.
+
+    Wherever the window ends up, it completely covers at least one row, and
+    has to fit in every row it covers completely. So if there's no room in
+    any row, there's no room for the window at all.
+    """
+    wx, wy, ww, wh = wa
+    ch = (height + 1) // 2
+    nrows = wh // ch
+
+    # A rectangle crossing rows r0 up to (not including) r1 is marked as two
+    # overlapping runs of 2**k rows each, where 2**k is the largest power of
+    # two that fits. levels[k][r] holds what's covered in rows r up to
+    # r + 2**k. That way, marking a rectangle costs the same no matter how
+    # many rows it crosses.
+    levels = [[0] * nrows for _ in xrange(nrows.bit_length())]
+    for rx, ry, rw, rh in rects:
+        x1 = rx - wx if rx > wx else 0
+        x2 = rx + rw - wx if rx + rw < wx + ww else ww
+        r0 = (ry - wy) // ch if ry > wy else 0
+        r1 = (ry + rh - 1 - wy) // ch + 1
+        if r1 > nrows:
+            r1 = nrows
+        if x1 >= x2 or r0 >= r1:
+            continue
+
+        mask = ((1 << (x2 - x1)) - 1) << x1
+        k = (r1 - r0).bit_length() - 1
+        level = levels[k]
+        level[r0] |= mask
+        level[r1 - (1 << k)] |= mask
+
+    # Now push each level down into the two halves below it
+    for k in xrange(len(levels) - 1, 0, -1):
+        half = 1 << (k - 1)
+        lower = levels[k - 1]
+        for r, covered in enumerate(levels[k]):
+            if covered:
+                lower[r] |= covered
+                lower[r + half] |= covered
+
+    # Only keep the positions where the whole window is free, i.e., bit i
+    # survives if bits i through i + width - 1 are all free.
+    full = (1 << ww) - 1
+    rows = []
+    for covered in levels[0]:
+        free = full & ~covered
+        run = 1
+        while free and run * 2 <= width:
+            free &= free >> run
+            run *= 2
+        if free and run < width:
+            free &= free >> (width - run)
+        rows.append(free)
+
+    return ch, rows
+
+def cascade(wa, rects, width, height):
+    """
+    Puts the window at the top left of the workarea, moving it down and to
+    the right for as long as another window already has its top left corner
+    there. Starts over from the top left if the window would go past the
+    bottom or right of the workarea.
+    """
+    taken = set([(x, y) for x, y, _, _ in rects])
+
+    x, y = wa[0], wa[1]
+    while (x, y) in taken:
+        x, y = x + cascade_step, y + cascade_step
+
+        if x + width > wa[0] + wa[2] or y + height > wa[1] + wa[3]:
+            return wa[0], wa[1]
+
+    return x, y
+
+def center(wa, width, height):
+    """Centers the window in the workarea."""
+    return __clamp(wa, wa[0] + (wa[2] - width) / 2,
+                   wa[1] + (wa[3] - height) / 2, width, height)
+
+def under_mouse(wa, width, height, px, py):
+    """
+    Centers the window on the pointer at (px, py), but keeps it inside of the
+    workarea.
+    """
+    return __clamp(wa, px - width / 2, py - height / 2, width, height)
+
+def __clamp(wa, x, y, width, height):
+    x = max(wa[0], min(x, wa[0] + wa[2] - width))
+    y = max(wa[1], min(y, wa[1] + wa[3] - height))
+
+    return x, y
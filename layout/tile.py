@@ -21,8 +21,16 @@ class DirectionLayout(Layout):
         if self.workspace.alternate is self:
             for client in self.clients():
                 client.frame_border()
+            for leaf in self._leaves.itervalues():
+                leaf.check_frame()
             self.root.moveresize(wa['x'], wa['y'], wa['width'], wa['height'])
 
+            # Leaves that didn't move are skipped above, but every tiled
+            # client still goes on top, in the same order as before.
+            if self.root.child is not None:
+                for leaf in self.root.childs():
+                    leaf.client.stack_raise()
+
     def add(self, client, force_master=False, doplace=True):
         Layout.add(self, client)
 
@@ -44,10 +52,9 @@ class DirectionLayout(Layout):
 
         Layout.remove(self, client)
 
-        for leaf in self.root.childs():
-            if leaf.client == client:
-                leaf.parent.remove_child(leaf)
-                break
+        leaf = self._leaves.pop(client, None)
+        if leaf is not None:
+            leaf.parent.remove_child(leaf)
 
     def remove_one(self, client):
         self.remove(client)
@@ -97,7 +104,7 @@ class DirectionLayout(Layout):
         moveto = self._get_direction('previous')
 
         if None not in (movefrom, moveto):
-            movefrom.switch(moveto)
+            self._switch(movefrom, moveto)
             self.place()
 
     def move_next(self):
@@ -105,7 +112,7 @@ class DirectionLayout(Layout):
         moveto = self._get_direction('next')
 
         if None not in (movefrom, moveto):
-            movefrom.switch(moveto)
+            self._switch(movefrom, moveto)
             self.place()
 
     def _cleanup(self):
@@ -145,44 +152,35 @@ class DirectionLayout(Layout):
         assert False, 'subclass responsibility'
 
     def _get_focused_leaf(self):
-        focused = focus.focused()
-        for leaf in self.root.childs():
-            if leaf.client is focused:
-                return leaf
-
-        return None
+        return self._leaves.get(focus.focused(), None)
 
     def _get_focused_section(self):
-        focused = focus.focused()
-
-        for leaf in self.master.childs():
-            if leaf.client is focused:
-                return self.master
-        for leaf in self.slave.childs():
-            if leaf.client is focused:
-                return self.slave
+        leaf = self._get_focused_leaf()
+        if leaf is not None and leaf.parent in (self.master, self.slave):
+            return leaf.parent
 
         return None
 
     def _get_focused_index(self, section):
-        focused = focus.focused()
+        leaf = self._get_focused_leaf()
+        if (leaf is not None and leaf.parent is section
+            and section in (self.master, self.slave)):
+            return section.children.index(leaf)
 
-        if section is self.master:
-            for i, leaf in enumerate(self.master.childs()):
-                if leaf.client is focused:
-                    return i
+        return 0
 
-        if section is self.slave:
-            for i, leaf in enumerate(self.slave.childs()):
-                if leaf.client is focused:
-                    return i
+    def _switch(self, leaf1, leaf2):
+        leaf1.switch(leaf2)
 
-        return 0
+        self._leaves[leaf1.client] = leaf1
+        self._leaves[leaf2.client] = leaf2
 
     def _add_to(self, section, client):
         assert isinstance(section, TileBox)
 
-        section.add_child(TileLeaf(section, client))
+        leaf = TileLeaf(section, client)
+        section.add_child(leaf)
+        self._leaves[client] = leaf
 
     def _add_master(self, client, append=False):
         assert self._masters() <= self.maxmasters
@@ -219,21 +217,17 @@ class DirectionLayout(Layout):
     def _section_split(self, section, i, client, append=False):
         assert False, 'subclass responsibility'
 
+    # Leaves are always direct children of the master and slave sections
+    # (see '_section_split'), so the sections count them for us.
     def _masters(self):
-        cnt = 0
-        if self.master is not None:
-            for _ in self.master.childs():
-                cnt += 1
-
-        return cnt
+        if self.master is None:
+            return 0
+        return len(self.master.children)
 
     def _slaves(self):
-        cnt = 0
-        if self.slave is not None:
-            for _ in self.slave.childs():
-                cnt += 1
-
-        return cnt
+        if self.slave is None:
+            return 0
+        return len(self.slave.children)
 
     def _save_proportions(self):
         # Only save if both master and slave are active
@@ -250,6 +244,7 @@ class VerticalLayout(DirectionLayout):
         self.maxmasters = 1
 
         self.root = TileRoot()
+        self._leaves = {} # client -> leaf
         self.root.add_child(TileHorizontalBox(self.root))
         self.master = TileVerticalBox(self.root.child)
         self.slave = TileVerticalBox(self.root.child)
@@ -259,7 +254,8 @@ class VerticalLayout(DirectionLayout):
     def _section_split(self, section, i, client, append=False):
         assert section in (self.master, self.slave)
 
-        section.children[i].split('vertical', client, append=append)
+        leaf = section.children[i].split('vertical', client, append=append)
+        self._leaves[client] = leaf
 
     def master_size_increase(self):
         if self._masters() and self._slaves():
@@ -304,6 +300,7 @@ class HorizontalLayout(DirectionLayout):
         self.maxmasters = 1
 
         self.root = TileRoot()
+        self._leaves = {} # client -> leaf
         self.root.add_child(TileVerticalBox(self.root))
         self.master = TileHorizontalBox(self.root.child)
         self.slave = TileHorizontalBox(self.root.child)
@@ -313,7 +310,8 @@ class HorizontalLayout(DirectionLayout):
     def _section_split(self, section, i, client, append=False):
         assert section in (self.master, self.slave)
 
-        section.children[i].split('horizontal', client, append=append)
+        leaf = section.children[i].split('horizontal', client, append=append)
+        self._leaves[client] = leaf
 
     def master_size_increase(self):
         if self._masters() and self._slaves():
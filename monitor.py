@@ -1,8 +1,40 @@
+"""
+Keeps track of the monitors (heads) attached to the screen, and the part of
+each one that isn't covered by struts (the workarea).
+
+Heads are found with RandR if it's available, then Xinerama, and otherwise
+the whole screen is a single head. With RandR, the heads are looked up again
+whenever the screen changes, and workspaces are moved around to match.
+"""
+import xcb
+import xcb.xproto as xproto
+
+try:
+    import xcb.randr as randr
+except ImportError:
+    randr = None
+
+try:
+    import xcb.xinerama as xinerama
+except ImportError:
+    xinerama = None
+
 import state
+import events
 import root
+import workspace
 
-heads = [(0, 0, 1920, 1080)]
-heads_wa = heads[:]
+heads = []
+heads_wa = []
+
+__randr = None
+
+# The part of each head's workarea that each client with struts leaves free,
+# keyed by client and then by head. A head's workarea is the intersection
+# of all of these. That way, when one client's struts change, only the
+# heads it touches (before or after) have to be worked out again. Every
+# mapped client with struts has an entry, even if it touches no head.
+__contribs = {}
 
 def which(fx, fy):
     for i, (x, y, w, h) in enumerate(heads):
@@ -14,53 +46,268 @@ def workarea(monitor):
 
     return heads_wa[monitor]
 
+def set_struts(client):
+    """
+    Updates what a client's struts take away from the workareas, and lets
+    any visible workspace whose workarea actually changed know about it. If
+    the client isn't mapped (or has no struts), it doesn't take anything.
+    """
+    old = __contribs.pop(client, {})
+    new = {}
+    if client.mapped and client.strut_partial:
+        # Kept even if it's empty, since the heads it would touch may show
+        # up later.
+        new = __strut_contribs(client.strut_partial)
+        __contribs[client] = new
+
+    changed = [i for i in set(old) | set(new) if old.get(i) != new.get(i)]
+    __workareas_changed([i for i in changed if __recalculate(i)])
+
 def strut_calculate():
-    # reset the workareas
-    for i, head, in enumerate(heads):
-        heads_wa[i] = head
-
-    for client in state.windows.itervalues():
-        s = client.strut
-        sp = client.strut_partial
-        if not client.mapped or not any((s, sp)):
+    """
+    Works out every client's struts, and every workarea, from scratch.
+    """
+    for client in __contribs.keys():
+        __contribs[client] = __strut_contribs(client.strut_partial)
+
+    __workareas_changed([i for i in xrange(len(heads)) if __recalculate(i)])
+
+def __workareas_changed(moved):
+    if not moved:
+        return
+
+    for wrk in state.workspaces.itervalues():
+        if wrk.monitor in moved:
+            wrk.workarea_changed()
+
+def __recalculate(i):
+    """
+    Recomputes the workarea of head 'i' from the struts that touch it, and
+    returns whether it changed.
+    """
+    old = heads_wa[i]
+
+    heads_wa[i] = heads[i]
+    for contrib in __contribs.itervalues():
+        if i in contrib:
+            __update_wa_monitor(i, contrib[i])
+
+    return heads_wa[i] != old
+
+def __strut_contribs(sp):
+    contribs = {}
+
+    for i, head in enumerate(heads):
+        x, y, w, h = head
+
+        bottom = sp['bottom_start_x'] != sp['bottom_end_x'] \
+                 and (__x_in_rect(sp['bottom_start_x'], head)
+                      or __x_in_rect(sp['bottom_end_x'], head))
+        top    = sp['top_start_x'] != sp['top_end_x'] \
+                 and (__x_in_rect(sp['top_start_x'], head)
+                      or __x_in_rect(sp['top_end_x'], head))
+        left   = sp['left_start_y'] != sp['left_end_y'] \
+                 and (__y_in_rect(sp['left_start_y'], head)
+                      or __y_in_rect(sp['left_end_y'], head))
+        right  = sp['right_start_y'] != sp['right_end_y'] \
+                 and (__y_in_rect(sp['right_start_y'], head)
+                      or __y_in_rect(sp['right_end_y'], head))
+
+        if bottom:
+            newh = h - (sp['bottom'] - ((root.height - h) - y))
+            contribs[i] = (x, y, w, newh)
+        elif top:
+            newh = h - (sp['top'] - y)
+            newy = sp['top']
+            contribs[i] = (x, newy, w, newh)
+        elif right:
+            neww = w - (sp['right'] - ((root.width - w) - x))
+            contribs[i] = (x, y, neww, h)
+        elif left:
+            neww = w - (sp['left'] - x)
+            newx = sp['left']
+            contribs[i] = (newx, y, neww, h)
+
+    return contribs
+
+def query_heads():
+    """
+    Returns the (x, y, width, height) of every active monitor, ordered by
+    position (left to right, then top to bottom).
+    """
+    found = []
+
+    if __randr is not None:
+        res = __randr.GetScreenResources(state.root).reply()
+        cookies = [__randr.GetCrtcInfo(crtc, res.config_timestamp)
+                   for crtc in res.crtcs]
+        for ck in cookies:
+            info = ck.reply()
+            if info.mode and info.width and info.height:
+                found.append((info.x, info.y, info.width, info.height))
+    elif xinerama is not None:
+        try:
+            ext = state.conn(xinerama.key)
+            if ext.IsActive().reply().state:
+                for info in ext.QueryScreens().reply().screen_info:
+                    found.append((info.x_org, info.y_org,
+                                  info.width, info.height))
+        except xcb.ExtensionException:
+            pass
+
+    # Cloned outputs show up once for each CRTC
+    found = sorted(set(found))
+
+    if not found:
+        found = [(0, 0, state.rsetup.width_in_pixels,
+                  state.rsetup.height_in_pixels)]
+
+    return found
+
+def __match_heads(old, new):
+    """
+    Works out which of the new heads each old head became. Returns a list
+    with, for every old head, the index of its new head or None if it went
+    away. Heads that kept their geometry are matched first, and whatever is
+    left over on both sides is paired up from left to right.
+    """
+    match = [None] * len(old)
+    left = range(len(new))
+
+    for i, geom in enumerate(old):
+        for j in left:
+            if new[j] == geom:
+                match[i] = j
+                left.remove(j)
+                break
+
+    unmatched = [i for i in xrange(len(old)) if match[i] is None]
+    byx = lambda heads: lambda i: (heads[i][0], heads[i][1])
+    unmatched.sort(key=byx(old))
+    left.sort(key=byx(new))
+    for i, j in zip(unmatched, left):
+        match[i] = j
+
+    return match
+
+def update_heads():
+    """
+    Looks up the heads again. If they changed, the workareas are worked out
+    again, workspaces on heads that went away are hidden, new heads get a
+    workspace, and workspaces on heads that moved or changed size are moved
+    along with them.
+    """
+    found = query_heads()
+    if found == heads:
+        return
+
+    old = heads[:]
+    old_wa = heads_wa[:]
+    match = __match_heads(old, found)
+
+    # Hiding a workspace saves where its windows are relative to its
+    # workarea, so it has to happen while the old heads are still around.
+    # Workspaces whose head moved are hidden too, and shown again on the
+    # new head below, which puts their windows back relative to where the
+    # head is now.
+    kept, moved = [], []
+    for wrk in state.workspaces.values():
+        if wrk.monitor is None:
             continue
 
-        for i, head in enumerate(heads):
-            x, y, w, h = head
-
-            if sp:
-                bottom = sp['bottom_start_x'] != sp['bottom_end_x'] \
-                         and (__x_in_rect(sp['bottom_start_x'], head)
-                              or __x_in_rect(sp['bottom_end_x'], head))
-                top    = sp['top_start_x'] != sp['top_end_x'] \
-                         and (__x_in_rect(sp['top_start_x'], head)
-                              or __x_in_rect(sp['top_end_x'], head))
-                left   = sp['left_start_y'] != sp['left_end_y'] \
-                         and (__y_in_rect(sp['left_start_y'], head)
-                              or __y_in_rect(sp['left_end_y'], head))
-                right  = sp['right_start_y'] != sp['right_end_y'] \
-                         and (__y_in_rect(sp['right_start_y'], head)
-                              or __y_in_rect(sp['right_end_y'], head))
-
-                if bottom:
-                    newh = h - (sp['bottom'] - ((root.height - h) - y))
-                    __update_wa_monitor(i, (x, y, w, newh))
-                elif top:
-                    newh = h - (sp['top'] - y)
-                    newy = sp['top']
-                    __update_wa_monitor(i, (x, newy, w, newh))
-                elif right:
-                    neww = w - (sp['right'] - ((root.width - w) - x))
-                    __update_wa_monitor(i, (x, y, neww, h))
-                elif left:
-                    neww = w - (sp['left'] - x)
-                    newx = sp['left']
-                    __update_wa_monitor(i, (newx, y, neww, h))
-
-    # Now apply these new struts!
-    for workspace in state.workspaces.itervalues():
-        if workspace.monitor is not None:
-            workspace.workarea_changed()
+        i, j = wrk.monitor, match[wrk.monitor]
+        if j is None:
+            wrk.hide()
+        elif old[i] != found[j]:
+            wrk.hide()
+            moved.append((wrk, j))
+        else:
+            kept.append((wrk, i, j))
+
+    heads[:] = found
+    heads_wa[:] = found
+
+    for client in __contribs.keys():
+        __contribs[client] = __strut_contribs(client.strut_partial)
+    for i in xrange(len(heads)):
+        __recalculate(i)
+
+    for wrk, i, j in kept:
+        wrk.monitor = j
+    for wrk, j in moved:
+        wrk.show(j)
+
+    assign_workspaces()
+
+    # The head didn't move, but struts on a head that did might still
+    # have changed its workarea.
+    __workareas_changed([j for wrk, i, j in kept if old_wa[i] != heads_wa[j]])
+
+def assign_workspaces():
+    """
+    Makes sure no workspace is on a head that doesn't exist, and that every
+    head has a workspace (as long as there are enough of them). If the
+    current workspace ended up hidden, one that is visible takes over.
+    """
+    workspaces = state.workspaces.values()
+
+    for wrk in workspaces:
+        if wrk.monitor is not None and wrk.monitor >= len(heads):
+            wrk.hide()
+
+    taken = set([w.monitor for w in workspaces if w.monitor is not None])
+    hidden = [w for w in workspaces if w.monitor is None]
+    for i in xrange(len(heads)):
+        if i not in taken and hidden:
+            hidden.pop(0).show(i)
+
+    if workspace.current().monitor is None and workspace.visible():
+        workspace.visible()[0].focused()
+
+def cb_ScreenChangeNotifyEvent(e):
+    state.rsetup.width_in_pixels = root.width = e.width
+    state.rsetup.height_in_pixels = root.height = e.height
+
+    events.register_latent_callback(__heads_changed)
+
+def cb_NotifyEvent(e):
+    # A CRTC can move or change mode without the screen changing size, in
+    # which case there is no ScreenChangeNotify.
+    if e.subCode == randr.Notify.CrtcChange:
+        events.register_latent_callback(__heads_changed)
+
+def __heads_changed():
+    # Every CRTC that changes sends its own notify, so the heads are only
+    # looked up once all of them have been handled.
+
+    # START GRAB
+    state.grab()
+    try:
+        update_heads()
+    finally:
+        state.ungrab()
+    # END GRAB
+
+def __init():
+    global __randr
+
+    if randr is not None:
+        try:
+            __randr = state.conn(randr.key)
+            __randr.QueryVersion(1, 2).reply()
+        except (xcb.ExtensionException, xproto.BadImplementation):
+            __randr = None
+
+    heads[:] = query_heads()
+    heads_wa[:] = heads
+
+    if __randr is not None:
+        __randr.SelectInput(state.root,
+                            randr.NotifyMask.ScreenChange
+                            | randr.NotifyMask.CrtcChange)
+        events.register_extension_event(randr.ScreenChangeNotifyEvent,
+                                        cb_ScreenChangeNotifyEvent)
+        events.register_extension_event(randr.NotifyEvent, cb_NotifyEvent)
 
 def __update_wa_monitor(moni, (x, y, w, h)):
     assert moni < len(heads_wa)
@@ -74,3 +321,4 @@ def __x_in_rect(xtest, (x, y, w, h)):
 def __y_in_rect(ytest, (x, y, w, h)):
     return ytest >= y and ytest < (y + h)
 
+__init()
@@ -1,6 +1,7 @@
 import state
 import window
 import events
+import rendering
 
 class _PopupWindow(window.GeometryWindow):
     def __init__(self):
@@ -8,6 +9,7 @@ class _PopupWindow(window.GeometryWindow):
 
     def destroy(self):
         events.unregister_window(self.id)
+        rendering.forget(self.id)
         state.conn.core.DestroyWindow(self.id)
 
     def clear(self):
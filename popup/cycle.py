@@ -2,11 +2,15 @@
 Here's how the cycle window currently works.
 
 Firstly, the parent and inner windows are created when Pyndow starts up. Of
-course, they are not mapped yet.
+course, they are not mapped yet. They stick around for as long as Pyndow
+does.
 
-Each icon is itself its own window. All icon windows are created and mapped
-when the cycle dialog is display. All icon windows are also *destroyed* when
-the cycle dialog goes away.
+Every icon is a thumbnail that is drawn into a pixmap, which is used as the
+background of the inner window. Thumbnails are made the first time a client
+shows up in the cycle dialog, and are cached (both as image data and as
+pixmaps on the server) until the client changes its icon or goes away. So
+showing the dialog only copies pixmaps around, and moving the highlight only
+redraws the two icons that changed.
 
 The only state that is changed while the cylce dialog is visible is that of
 cycling through the windows to determine which to focus (i.e., the "active"
@@ -25,15 +29,13 @@ dialog is hidden, that the window it wants to give focus to still exists.
 import xcb.xproto
 
 import xpybutil.image as image
-import xpybutil.event as event
 
 import state
-import events
 import focus
+import hooks
 import window
 import config
 import rendering
-import grab
 from popup import _PopupWindow
 
 c_brdr_sz = config.get_option('cycle_brdr_sz')
@@ -41,61 +43,72 @@ c_brdr_clr = config.get_option('cycle_brdr_clr')
 c_bg = config.get_option('cycle_bg')
 c_icn_sz = config.get_option('cycle_icn_sz')
 
-class IconWindow(_PopupWindow):
-    def __new__(cls, parent, client):
-        self = _PopupWindow.__new__(cls)
-
-        mask = xcb.xproto.CW.BackPixel
-        values = [c_bg]
-        self.id = window.create(parent.inner.id, mask, values)
+# The size of an icon, including the border that shows it's highlighted
+c_cell_sz = c_icn_sz + (2 * c_brdr_sz)
 
-        self.parent = parent
-        self.client = client
+# Client icons, scaled to c_icn_sz, as (image, mask) tuples.
+__icons = {}
 
-        return self
+# Maps a client to {alpha: (inactive data, active data)}. A thumbnail holds
+# on to its pixmaps on the server until it is forgotten.
+__thumbs = {}
 
-    def __init__(self, *_):
-        _PopupWindow.__init__(self)
+def thumbnail(client):
+    """
+    Returns the image data of the icon of 'client' as it appears in the cycle
+    dialog, as an (inactive, active) tuple. Icons of clients that aren't
+    mapped are faded.
+    """
+    alpha = 1 if client.mapped else 0.3
+    thumbs = __thumbs.setdefault(client, {})
 
-        self.width = self.height = c_icn_sz + (2 * c_brdr_sz)
+    if alpha not in thumbs:
+        if client not in __icons:
+            __icons[client] = __scaled_icon(client)
+        im, immask = __icons[client]
 
-        self.configure(width=self.width, height=self.height)
+        icon_im = rendering.blend(im, immask, c_bg, c_icn_sz, c_icn_sz, alpha)
 
-        icon = self.client.win.get_icon(c_icn_sz, c_icn_sz)
+        im_inactive = rendering.box(c_bg, c_cell_sz, c_cell_sz)
+        im_inactive.paste(icon_im, box=(c_brdr_sz, c_brdr_sz))
 
-        im = image.get_image(icon['width'], icon['height'], icon['data'])
-        im = im.resize((c_icn_sz, c_icn_sz))
+        im_active = rendering.box(c_brdr_clr, c_cell_sz, c_cell_sz)
+        im_active.paste(icon_im, box=(c_brdr_sz, c_brdr_sz))
 
-        if 'mask' in icon and icon['mask'] and icon['mask'] != icon['data']:
-            immask = image.get_bitmap(icon['width'], icon['height'],
-                                      icon['mask'])
-            immask = immask.resize((c_icn_sz, c_icn_sz))
-        else:
-            immask = im.copy()
+        thumbs[alpha] = (image.get_data(im_inactive), image.get_data(im_active))
+        for data in thumbs[alpha]:
+            rendering.acquire_pix(data, c_cell_sz, c_cell_sz)
 
-        alpha = 1
-        if not self.client.mapped:
-            alpha = 0.3
-        icon_im = rendering.blend(im, immask, c_bg, c_icn_sz, c_icn_sz, alpha)
+    return thumbs[alpha]
 
-        im_inactive = rendering.box(c_bg, self.width, self.height)
-        im_inactive.paste(icon_im, box=(c_brdr_sz, c_brdr_sz))
+def forget(client):
+    """
+    Throws away the thumbnails of 'client', so they're made again the next
+    time they're needed.
+    """
+    __icons.pop(client, None)
 
-        im_active = rendering.box(c_brdr_clr, self.width, self.height)
-        im_active.paste(icon_im, box=(c_brdr_sz, c_brdr_sz))
+    for thumb in __thumbs.pop(client, {}).itervalues():
+        for data in thumb:
+            rendering.release_pix(data, c_cell_sz, c_cell_sz)
 
-        self.inactive = image.get_data(im_inactive)
-        self.active = image.get_data(im_active)
+def __scaled_icon(client):
+    icon = client.win.get_icon(c_icn_sz, c_icn_sz)
 
-        self.render_inactive()
+    im = image.get_image(icon['width'], icon['height'], icon['data'])
+    im = im.resize((c_icn_sz, c_icn_sz))
 
-        self.map()
+    if 'mask' in icon and icon['mask'] and icon['mask'] != icon['data']:
+        immask = image.get_bitmap(icon['width'], icon['height'],
+                                  icon['mask'])
+        immask = immask.resize((c_icn_sz, c_icn_sz))
+    else:
+        immask = im.copy()
 
-    def render_inactive(self):
-        rendering.paint_pix(self.id, self.inactive, self.width, self.height)
+    return im, immask
 
-    def render_active(self):
-        rendering.paint_pix(self.id, self.active, self.width, self.height)
+hooks.attach('client_icon_changed', forget)
+hooks.attach('client_unmanage', forget)
 
 class CycleWindow(_PopupWindow):
     def __new__(cls):
@@ -114,11 +127,20 @@ class CycleWindow(_PopupWindow):
     def __init__(self):
         _PopupWindow.__init__(self)
 
-        # Create the inner window
+        # Create the inner window. It's only ever visible when we are.
         inner_id = window.create(self.id, xcb.xproto.CW.BackPixel, [c_bg])
         self.inner = window.GeometryWindow(inner_id)
+        self.inner.map()
+
+        # The background of the inner window, and its size
+        self._pix = None
+        self._pix_size = None
 
-        self.icons = []
+        # The thumbnails being shown, and the pixmaps they're drawn from.
+        # We hold on to the pixmaps until we're hidden, in case one of the
+        # thumbnails is forgotten in the mean time.
+        self.thumbs = []
+        self.pixmaps = []
         self.wins = []
 
         self.current = 0
@@ -134,8 +156,8 @@ class CycleWindow(_PopupWindow):
 
         # c_brdr_sz is used for the border around the window and
         # around each of the icons... meh
-        w = (len(self.wins) * (c_icn_sz + (2 * c_brdr_sz))) + 20 + (2 * c_brdr_sz)
-        h = c_icn_sz + (2 * c_brdr_sz) + 20 + (2 * c_brdr_sz)
+        w = (len(self.wins) * c_cell_sz) + 20 + (2 * c_brdr_sz)
+        h = c_cell_sz + 20 + (2 * c_brdr_sz)
 
         x = (sw / 2) - (w / 2)
         y = (sh / 2) - (h / 2)
@@ -159,17 +181,12 @@ class CycleWindow(_PopupWindow):
                              width=self.geom['width'] - 2 * c_brdr_sz,
                              height=self.geom['height'] - 2 * c_brdr_sz)
 
-        self.icons = []
-        for i, client in enumerate(self.wins):
-            icon = IconWindow(self, client)
-            self.icons.append(icon)
-
-            icon.configure(x=10 + i * (c_icn_sz + (2 * c_brdr_sz)), y=10)
+        self.thumbs = [thumbnail(client) for client in self.wins]
+        self.pixmaps = [tuple(rendering.acquire_pix(data, c_cell_sz, c_cell_sz)
+                              for data in thumb)
+                        for thumb in self.thumbs]
 
-            if i == self.current:
-                icon.render_active()
-
-        self.inner.map()
+        self.compose()
         self.map()
 
         self.showing = True
@@ -178,8 +195,10 @@ class CycleWindow(_PopupWindow):
 
     def hide(self):
         self.unmap()
-        for icon in self.icons:
-            icon.destroy()
+
+        for thumb in self.thumbs:
+            for data in thumb:
+                rendering.release_pix(data, c_cell_sz, c_cell_sz)
 
         client = self.wins[self.current]
 
@@ -193,17 +212,56 @@ class CycleWindow(_PopupWindow):
         self.current = 0
         self.showing = False
         self.wins = []
-        del self.icons
+        self.thumbs = []
+        self.pixmaps = []
+
+    def compose(self):
+        """
+        Draws every icon into the background of the inner window. The pixmap
+        is only made again when the number of icons changes.
+        """
+        w, h = self.inner.geom['width'], self.inner.geom['height']
+
+        if self._pix_size != (w, h):
+            old = self._pix
+            self._pix = state.conn.generate_id()
+            self._pix_size = (w, h)
+            state.conn.core.CreatePixmap(state.rsetup.root_depth, self._pix,
+                                         self.inner.id, w, h)
+            state.conn.core.ChangeWindowAttributes(self.inner.id,
+                                                   xcb.xproto.CW.BackPixmap,
+                                                   [self._pix])
+
+            if old is not None:
+                state.conn.core.FreePixmap(old)
+
+        rendering.fill(self._pix, c_bg, [(0, 0, w, h)])
+        for i in xrange(len(self.wins)):
+            self._draw_icon(i)
+
+        state.conn.core.ClearArea(0, self.inner.id, 0, 0, 0, 0)
 
     def highlight_next(self):
-        self.icons[self.current].render_inactive()
-        self.current = (self.current + 1) % len(self.icons)
-        self.icons[self.current].render_active()
+        self._highlight(self.current + 1)
 
     def highlight_previous(self):
-        self.icons[self.current].render_inactive()
-        self.current = (self.current - 1) % len(self.icons)
-        self.icons[self.current].render_active()
+        self._highlight(self.current - 1)
+
+    def _highlight(self, i):
+        old, self.current = self.current, i % len(self.wins)
+
+        for j in (old, self.current):
+            x, y = self._draw_icon(j)
+            state.conn.core.ClearArea(0, self.inner.id, x, y,
+                                      c_cell_sz, c_cell_sz)
+
+    def _draw_icon(self, i):
+        x, y = 10 + i * c_cell_sz, 10
+        pix = self.pixmaps[i][1 if i == self.current else 0]
+
+        rendering.copy_pix(pix, self._pix, x, y, c_cell_sz, c_cell_sz)
+
+        return x, y
 
 # Initialize the popup window... Doesn't map it yet, though
 cycle = CycleWindow()
@@ -1,4 +1,5 @@
 from functools import partial
+import select
 import sys
 import time
 import traceback
@@ -9,7 +10,6 @@ import xcb.xproto as xproto
 import xpybutil.util as util
 import xpybutil.icccm as icccm
 import xpybutil.ewmh as ewmh
-import xpybutil.event as event
 
 import state
 import root
@@ -17,8 +17,10 @@ import config
 import window
 import events
 import grab
+import timer
 import command
 import client
+import monitor
 import misc
 
 aid = partial(util.get_atom, state.conn)
@@ -53,13 +55,33 @@ events.register_callback(xproto.MotionNotifyEvent, grab.drag_do,
 events.register_callback(xproto.ButtonReleaseEvent, grab.drag_end,
                          state.pyndow, None, None, None)
 
+monitor.assign_workspaces()
+client.manage_existing()
+
 state.root_focus()
 
+xfd = state.conn.get_file_descriptor()
+
 while True:
-    event.read(state.conn, block=True)
-    for e in event.queue():
+    # Only block indefinitely if there are no timers waiting. Otherwise,
+    # wait on the X connection until the next timer is due.
+    wait = timer.next_timeout()
+    if wait is None:
+        xevents = events.read(block=True)
+    else:
+        xevents = events.read()
+        if not xevents:
+            select.select([xfd], [], [], wait)
+            xevents = events.read()
+
+    xevents = events.compress_motion(xevents)
+    client.note_pending(xevents)
+
+    for e in xevents:
         events.dispatch(e)
 
+    timer.run()
+
     events.run_latent()
 
     state.conn.flush()
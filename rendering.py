@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from functools import partial
 import os.path
 
@@ -7,6 +8,7 @@ import Image, ImageDraw, ImageFont
 import xpybutil.image as image
 
 from state import conn, core, root, rsetup
+import xshm
 
 imgs = os.path.join('/', 'home', 'andrew', 'clones', 'pyndow', 'images')
 stdgc = conn.generate_id()
@@ -21,18 +23,107 @@ restore = Image.open(p('restore.png'))
 shade = Image.open(p('shade.png'))
 openbox = Image.open(p('openbox.png'))
 
-def paint_pix(wid, data, w, h):
+# A cache of server side pixmaps, keyed by their contents:
+# (image data, width, height, depth). Each entry is [pixmap id, refcount],
+# where the refcount is the number of windows using the pixmap as their
+# background. That way, identical decorations (like the borders of every
+# inactive frame) share a single pixmap, and switching between images that
+# are already on the server doesn't upload anything.
+__pixmaps = {}
+
+# Maps a window id to the key of the pixmap it is currently painted with.
+__painted = {}
+
+# Pixmaps that are no longer used by any window, least recently used first.
+# They are kept around for a little while, since focus changes tend to
+# switch back and forth between the same images.
+__unused = OrderedDict()
+__unused_max = 64
+
+def __acquire(key):
+    if key in __pixmaps:
+        __unused.pop(key, None)
+        __pixmaps[key][1] += 1
+
+        return __pixmaps[key][0]
+
+    data, w, h, depth = key
+
     pix = conn.generate_id()
-    core.CreatePixmap(rsetup.root_depth, pix, root, w, h)
+    core.CreatePixmap(depth, pix, root, w, h)
+
+    if not xshm.put_image(pix, stdgc, w, h, 24, data):
+        core.PutImage(xproto.ImageFormat.ZPixmap, pix, stdgc, w, h, 0, 0, 0,
+                      24, len(data), data)
+
+    __pixmaps[key] = [pix, 1]
 
-    core.PutImage(xproto.ImageFormat.ZPixmap, pix, stdgc, w, h, 0, 0, 0, 24, 
-                  len(data), data)
+    return pix
+
+def __release(key):
+    __pixmaps[key][1] -= 1
+    if __pixmaps[key][1] > 0:
+        return
+
+    __unused[key] = True
+    while len(__unused) > __unused_max:
+        old, _ = __unused.popitem(last=False)
+        core.FreePixmap(__pixmaps.pop(old)[0])
+
+def paint_pix(wid, data, w, h):
+    key = (data, w, h, rsetup.root_depth)
+    old = __painted.get(wid)
+
+    if old == key:
+        return
+
+    pix = __acquire(key)
+    __painted[wid] = key
+
+    if old is not None:
+        __release(old)
 
     core.ChangeWindowAttributes(wid, xproto.CW.BackPixmap, [pix])
 
     core.ClearArea(0, wid, 0, 0, 0, 0)
 
-    core.FreePixmap(pix)
+def acquire_pix(data, w, h):
+    """
+    Returns a (cached) pixmap containing the given image data. Every call
+    must eventually be matched with a call to 'release_pix'.
+    """
+    return __acquire((data, w, h, rsetup.root_depth))
+
+def release_pix(data, w, h):
+    __release((data, w, h, rsetup.root_depth))
+
+def fill(drawable, color, rects):
+    """
+    Fills each (x, y, width, height) rectangle in 'rects' with 'color'.
+    """
+    core.ChangeGC(stdgc, xproto.GC.Foreground, [color])
+    core.PolyFillRectangle(drawable, stdgc, len(rects),
+                           [v for rect in rects for v in rect])
+
+def copy_pix(src, dst, x, y, w, h):
+    core.CopyArea(src, dst, stdgc, 0, 0, x, y, w, h)
+
+def forget(wid):
+    """
+    Releases the pixmap that a window is painted with. This should be called
+    when a window that has been painted with 'paint_pix' is destroyed.
+    """
+    if wid in __painted:
+        __release(__painted.pop(wid))
+
+# Fonts that have been loaded, keyed by (font file, size).
+__fonts = {}
+
+# Rendered text, least recently used first. Keyed by everything that goes
+# into the image: (font file, size, text, bg color, text color, max width,
+# max height). Each entry is (image data, width, height).
+__texts = OrderedDict()
+__texts_max = 256
 
 def draw_text_bgcolor(font, text, color_bg, color_text, max_width, max_height):
     fw, fh = get_text_extents(font, text)
@@ -47,9 +138,35 @@ def draw_text_bgcolor(font, text, color_bg, color_text, max_width, max_height):
     return im
 
 def create_font(font, size):
-    f = ImageFont.truetype(font, size, encoding='unic')
-
-    return f
+    key = (font, size)
+    if key not in __fonts:
+        __fonts[key] = ImageFont.truetype(font, size, encoding='unic')
+
+    return __fonts[key]
+
+def text_data(font_file, size, text, color_bg, color_text,
+              max_width, max_height):
+    """
+    Returns (data, width, height) of 'text' drawn on 'color_bg'. Results are
+    cached, so windows that keep setting the same few titles (or several
+    frames asking for the same title in each of their states) only pay for
+    drawing it once.
+    """
+    key = (font_file, size, text, color_bg, color_text, max_width, max_height)
+
+    if key in __texts:
+        __texts[key] = __texts.pop(key)
+        return __texts[key]
+
+    im = draw_text_bgcolor(create_font(font_file, size), text,
+                           color_bg, color_text, max_width, max_height)
+    w, h = im.size
+    __texts[key] = (image.get_data(im), w, h)
+
+    while len(__texts) > __texts_max:
+        __texts.popitem(last=False)
+
+    return __texts[key]
 
 def get_text_extents(font, text):
     return font.getsize(unicode(text, 'utf-8'))
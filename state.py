@@ -7,6 +7,9 @@ import xcb.xproto as xproto
 import xpybutil.cursor as cursor
 import xpybutil.keysym as keysym
 
+import hooks
+import xerror
+
 d = open('/home/andrew/pyndow.txt', 'w+')
 
 die    = False
@@ -16,10 +19,6 @@ setup  = conn.get_setup()
 rsetup = setup.roots[0]
 root   = rsetup.root
 
-# Temporary hack
-rsetup.width_in_pixels  = 1920
-rsetup.height_in_pixels = 1080
-
 pyndow = conn.generate_id()
 core.CreateWindow(rsetup.root_depth, pyndow, root, -1000, -1000, 1,
                        1, 0, xproto.WindowClass.InputOutput, rsetup.root_visual,
@@ -81,18 +80,45 @@ def set_keys_to_mods(ktom):
     __keystomods = ktom
 
 def replay_pointer():
-    core.AllowEventsChecked(xproto.Allow.ReplayPointer,
-                            xproto.Time.CurrentTime).check()
+    xerror.send('replay_pointer', core.AllowEvents,
+                xproto.Allow.ReplayPointer, xproto.Time.CurrentTime)
 
 def root_focus():
-    core.SetInputFocusChecked(xproto.InputFocus.PointerRoot, root,
-                              xproto.Time.CurrentTime).check()
+    xerror.send('root_focus', core.SetInputFocus,
+                xproto.InputFocus.PointerRoot, root, xproto.Time.CurrentTime)
+
+# How deep we are into nested server grabs. Only the outermost grab and
+# ungrab actually go to the server, so something like a workspace switch can
+# wrap many maps and unmaps (that each grab for themselves) in one grab.
+# Always release a grab in a 'finally' block: if an exception leaks past a
+# grab, the server stays grabbed and 'flush' never flushes again.
+__grabs = 0
 
 def grab():
-    core.GrabServerChecked().check()
+    global __grabs
+
+    __grabs += 1
+    if __grabs == 1:
+        xerror.send('grab', core.GrabServer)
 
 def ungrab():
-    core.UngrabServerChecked().check()
+    global __grabs
+
+    assert __grabs > 0, 'ungrab without a grab'
+
+    __grabs -= 1
+    if not __grabs:
+        hooks.fire('ungrab')
+        xerror.send('ungrab', core.UngrabServer)
+        conn.flush()
+
+def flush():
+    """
+    Flushes the connection, unless we're in the middle of a server grab.
+    In that case, everything goes out at once when the grab is released.
+    """
+    if not __grabs:
+        conn.flush()
 
 def sync():
     core.GetInputFocus().reply()
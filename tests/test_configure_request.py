@@ -0,0 +1,150 @@
+"""
+Checks what a managed client gets back when it sends a ConfigureRequest.
+
+There's no X server to talk to here, so the X bindings and the pyndow
+modules that talk to the server on import are swapped out for fakes that
+record every request sent.
+"""
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Everything sent to the "server", in order
+sent = []
+
+class Anything(object):
+    def __getattr__(self, name):
+        return Anything()
+
+    def __call__(self, *args, **kwargs):
+        return Anything()
+
+class FakeModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Anything()
+
+def fake(name, **attrs):
+    mod = FakeModule(name)
+    mod.__dict__.update(attrs)
+    sys.modules[name] = mod
+
+    if '.' in name:
+        parent, child = name.rsplit('.', 1)
+        setattr(sys.modules[parent], child, mod)
+
+    return mod
+
+class Cookie(object):
+    sequence = 0
+
+class Core(object):
+    def ConfigureWindow(self, wid, mask, values):
+        sent.append(('ConfigureWindow', wid, mask, list(values)))
+        return Cookie()
+
+    def __getattr__(self, name):
+        return Anything()
+
+class Conn(object):
+    core = Core()
+
+    def __init__(self):
+        self.__next = 100
+
+    def generate_id(self):
+        self.__next += 1
+        return self.__next
+
+def send_event(conn, wid, mask, packed):
+    sent.append(('SendEvent', wid, packed))
+
+fake('xcb')
+fake('xcb.xproto',
+     ConfigWindow=type('ConfigWindow', (), dict(X=1, Y=2, Width=4, Height=8,
+                                                BorderWidth=16, Sibling=32,
+                                                StackMode=64)),
+     EventMask=type('EventMask', (), dict(StructureNotify=131072)),
+     GetGeometryCookie=type('GetGeometryCookie', (), {}))
+fake('xpybutil')
+for sub in ('util', 'icccm', 'ewmh', 'motif', 'image', 'cursor', 'keysym'):
+    fake('xpybutil.' + sub)
+fake('xpybutil.event', send_event=send_event)
+
+conn = Conn()
+fake('state', conn=conn, core=conn.core,
+     rsetup=type('Setup', (), dict(root_depth=24, root_visual=0)))
+fake('events', register_latent_callback=lambda cb: None)
+for name in ('layers', 'rendering', 'focus', 'frame', 'timer', 'workspace',
+             'monitor', 'config', 'config.mousebind'):
+    fake(name)
+
+import window
+import client
+
+class Frame(object):
+    """
+    Just enough of a frame to move its parent window around, with the
+    client sitting at a fixed spot inside it.
+    """
+    def __init__(self):
+        self.parent = window.GeometryWindow(window.create(0, 0, []))
+        self.parent.geom.update(x=100, y=50, width=220, height=225)
+        self.pos = {'client': {'x': 10, 'y': 20, 'width': 20, 'height': 25}}
+
+    def configure_client(self, x=None, y=None, width=None, height=None,
+                         border_width=None, sibling=None, stack_mode=None):
+        self.parent.configure(x=x, y=y)
+
+class Event(object):
+    def __init__(self, **values):
+        conf = client.xcb.xproto.ConfigWindow
+        self.value_mask = 0
+        for name, flag in (('x', conf.X), ('y', conf.Y),
+                           ('width', conf.Width), ('height', conf.Height)):
+            if name in values:
+                self.value_mask |= flag
+            setattr(self, name, values.get(name, 0))
+        self.border_width = self.sibling = self.stack_mode = 0
+
+class TestConfigureRequest(unittest.TestCase):
+    def setUp(self):
+        del sent[:]
+
+        self.client = object.__new__(client.NormalClient)
+        self.client.win = window.GeometryWindow(window.create(0, 0, []))
+        self.client.win.geom.update(x=10, y=20, width=200, height=200)
+        self.client.frame = Frame()
+        self.client.mapped = False
+
+    def request(self, **values):
+        self.client.cb_ConfigureRequestEvent(Event(**values))
+
+        # This is what happens once the current batch of events is done
+        window.flush_configures()
+
+    def test_move_then_noop(self):
+        parent = self.client.frame.parent.id
+
+        self.request(x=300, y=400)
+        self.request()
+
+        kinds = [req[0] for req in sent]
+        self.assertEqual(kinds,
+                         ['ConfigureWindow', 'SendEvent', 'SendEvent'])
+        self.assertEqual(sent[0][1], parent)
+        self.assertEqual(sent[0][3], [300, 400])
+
+        # Both notifies have the client where it ended up
+        for req in sent[1:]:
+            self.assertEqual(req[1], self.client.win.id)
+            self.assertEqual(req[2], sent[1][2])
+        x, y = client.struct.unpack('=BxHIIIhhHHHB5x', sent[1][2])[5:7]
+        self.assertEqual((x, y), (310, 420))
+
+if __name__ == '__main__':
+    unittest.main()
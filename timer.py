@@ -0,0 +1,129 @@
+"""
+Timeouts and intervals that run inside Pyndow's main event loop.
+
+Timers are kept in a heap ordered by when they are next due. The main loop
+asks for the time until the next timer is due and uses it as the timeout
+when waiting on the X connection's file descriptor. Once it wakes up (either
+because of X events or because the timeout passed), it calls 'run' to fire
+every timer that is due.
+
+Any number of timers can be active for any window. Timers can be associated
+with an owner (typically a window id) so that they can all be cancelled at
+once when that window goes away.
+"""
+from collections import defaultdict
+import heapq
+import itertools
+import time
+
+# A heap of (due time, sequence number, timer). Cancelled timers are left in
+# the heap and skipped when they come up.
+__heap = []
+
+# Breaks ties between timers that are due at the same time, so that timers
+# fire in the order they were added (and are never compared to each other).
+__seq = itertools.count()
+
+# A set of active timers, keyed by owner.
+__owned = defaultdict(set)
+
+class Timer(object):
+    def __init__(self, delay, callback, count, owner):
+        self.delay = delay / 1000.0
+        self.callback = callback
+        self.count = count
+        self.owner = owner
+        self.active = True
+
+    def cancel(self):
+        cancel(self)
+
+def __schedule(tmr, due):
+    heapq.heappush(__heap, (due, next(__seq), tmr))
+
+def timeout(delay, callback, owner=None):
+    """
+    Calls 'callback' once after 'delay' milliseconds.
+    """
+    return interval(delay, callback, 1, owner)
+
+def interval(delay, callback, count=None, owner=None):
+    """
+    Calls 'callback' every 'delay' milliseconds, 'count' times. If 'count'
+    is None, the interval runs until it is cancelled.
+    """
+    assert delay >= 0
+    assert count is None or count > 0
+
+    tmr = Timer(delay, callback, count, owner)
+
+    if owner is not None:
+        __owned[owner].add(tmr)
+
+    __schedule(tmr, time.time() + tmr.delay)
+
+    return tmr
+
+def cancel(tmr):
+    if not tmr.active:
+        return
+
+    tmr.active = False
+
+    if tmr.owner is not None and tmr.owner in __owned:
+        __owned[tmr.owner].discard(tmr)
+        if not __owned[tmr.owner]:
+            del __owned[tmr.owner]
+
+def cancel_owner(owner):
+    """
+    Cancels every active timer belonging to 'owner'.
+    """
+    for tmr in list(__owned.get(owner, ())):
+        tmr.cancel()
+
+def active(owner):
+    return bool(__owned.get(owner))
+
+def next_timeout():
+    """
+    Returns the number of seconds until the next timer is due, or None if
+    there are no timers.
+    """
+    while __heap and not __heap[0][2].active:
+        heapq.heappop(__heap)
+
+    if not __heap:
+        return None
+
+    return max(0, __heap[0][0] - time.time())
+
+def run():
+    """
+    Fires every timer that is due. Intervals are rescheduled relative to
+    when they were due, but never in the past. (So a stalled event loop
+    doesn't cause a burst of catch up calls.)
+    """
+    now = time.time()
+
+    due = []
+    while __heap and __heap[0][0] <= now:
+        due.append(heapq.heappop(__heap))
+
+    for when, _, tmr in due:
+        # A callback fired before this one may have cancelled it
+        if not tmr.active:
+            continue
+
+        if tmr.count is not None:
+            tmr.count -= 1
+
+        if tmr.count == 0:
+            cancel(tmr)
+        else:
+            when += tmr.delay
+            if when <= now:
+                when = now + tmr.delay
+            __schedule(tmr, when)
+
+        tmr.callback()
@@ -0,0 +1,69 @@
+"""
+A cheap, in-memory tracer for event dispatch.
+
+When enabled, every dispatched event is recorded in a fixed size ring buffer
+as a (timestamp, event type, window, handler, duration) tuple. Nothing is
+written anywhere until the buffer is dumped, so tracing can be left on
+without slowing down event processing much. It is off by default.
+"""
+from collections import deque
+import time
+
+import state
+import config
+
+enabled = False
+
+__records = deque(maxlen=config.get_option('trace_size'))
+
+clock = time.time
+
+def enable():
+    global enabled
+
+    enabled = True
+
+def disable():
+    global enabled
+
+    enabled = False
+
+def toggle():
+    global enabled
+
+    enabled = not enabled
+
+def clear():
+    __records.clear()
+
+def record(xevent, handler, start):
+    """
+    Adds a record for an event that started being handled at 'start'.
+    The window is the 'window' attribute of the event if it has one, and
+    the 'event' attribute otherwise.
+    """
+    wid = getattr(xevent, 'window', None)
+    if wid is None:
+        wid = getattr(xevent, 'event', None)
+
+    __records.append((start, xevent.__class__.__name__, wid,
+                      handler.__name__, clock() - start))
+
+def records():
+    return list(__records)
+
+def dump(out=None):
+    """
+    Writes every record in the buffer, oldest first, to 'out'. By default,
+    the records are written to Pyndow's debug file.
+    """
+    if out is None:
+        out = state.d
+
+    for stamp, etype, wid, handler, duration in __records:
+        print >> out, '%0.6f %-22s %-10s %-30s %0.3fms' % (
+            stamp, etype, hex(wid) if wid is not None else '-', handler,
+            duration * 1000)
+    print >> out, '-' * 45
+
+    out.flush()
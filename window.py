@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import struct
 
 import xcb.xproto as xproto
@@ -11,8 +12,22 @@ import xpybutil.image as image
 
 from state import conn, core, rsetup
 import events
+import hooks
 import layers
 import rendering
+import xerror
+
+# Geometry changes that haven't been sent yet, keyed by window id. Each is a
+# dict from a ConfigWindow flag to its value. Changes to the same window are
+# merged, and sent as one request once the current batch of events has been
+# dispatched, when the window is mapped or restacked, or right before the
+# server is ungrabbed. (See 'flush_configures'.)
+__configures = OrderedDict()
+
+# The depths of windows made with 'create' or 'create_input' that haven't
+# been wrapped in a GeometryWindow yet. We know exactly what their geometry
+# is, so there's no need to ask the server for it.
+__created = {}
 
 def create(parent, mask, values):
     wid = conn.generate_id()
@@ -20,76 +35,145 @@ def create(parent, mask, values):
                                  1, 0, xproto.WindowClass.InputOutput,
                                  rsetup.root_visual,
                                  mask, values)
+    __created[wid] = rsetup.root_depth
+
+    return wid
+
+def create_input(parent, mask, values):
+    wid = conn.generate_id()
+    core.CreateWindow(0, wid, parent, 0, 0, 1, 1, 0,
+                      xproto.WindowClass.InputOnly, 0, mask, values)
+    __created[wid] = 0
 
     return wid
 
+def created_geom(wid):
+    """
+    Returns the geometry of a window that was just made with 'create' or
+    'create_input', or None if we didn't make it.
+    """
+    if wid not in __created:
+        return None
+
+    return {'x': 0, 'y': 0, 'width': 1, 'height': 1, 'border_width': 0,
+            'depth': __created.pop(wid)}
+
+def __send_configure(wid, values):
+    # The ConfigWindow flags are in the same order as the values need to be
+    mask = 0
+    vals = []
+    for flag in sorted(values):
+        mask |= flag
+        vals.append(values[flag])
+
+    xerror.send('configure', core.ConfigureWindow, wid, mask, vals)
+
+def queue_configure(wid, values):
+    if not values:
+        return
+
+    __configures.setdefault(wid, {}).update(values)
+    events.register_latent_callback(flush_configures)
+
+def flush_configures(wid=None):
+    """
+    Sends the pending configure requests of the given window, or of every
+    window if no window is given.
+    """
+    if wid is not None:
+        if wid in __configures:
+            __send_configure(wid, __configures.pop(wid))
+        return
+
+    while __configures:
+        __send_configure(*__configures.popitem(last=False))
+
+def forget(wid):
+    """
+    Drops any pending configure requests for a window that is about to be
+    destroyed.
+    """
+    __configures.pop(wid, None)
+
+hooks.attach('ungrab', flush_configures)
+
 class SimpleWindow(object):
     def __init__(self, wid):
         self.id = wid
 
     def map(self):
+        flush_configures(self.id)
         core.MapWindow(self.id)
 
     def unmap(self):
+        flush_configures(self.id)
         core.UnmapWindow(self.id)
 
     def configure(self, x=None, y=None, width=None, height=None,
                   border_width=None, sibling=None, stack_mode=None):
-        mask = 0
-        values = []
+        """
+        Only the values that differ from the cached geometry are sent, and
+        geometry changes are put off until the end of the current batch of
+        events (see 'queue_configure'). Restacking is sent right away, along
+        with anything else pending for the window.
+
+        The cached geometry is updated right away though, so it's what the
+        window will look like once everything pending has been sent, not
+        what the server has now. Anything that tells another client where
+        the window is has to flush the window's configures first.
+        """
+        values = {}
         conf = xproto.ConfigWindow
+        geom = self.geom
 
-        if x is not None:
-            self.geom['x'] = x
-
-            mask |= conf.X
+        if x is not None and x != geom['x']:
+            geom['x'] = x
 
             if x < 0:
                 x = 2 ** 32 + x
-            values.append(x)
-        if y is not None:
-            self.geom['y'] = y
-
-            mask |= conf.Y
+            values[conf.X] = x
+        if y is not None and y != geom['y']:
+            geom['y'] = y
 
             if y < 0:
                 y = 2 ** 32 + y
-            values.append(y)
-        if width is not None:
-            self.geom['width'] = width
-
-            mask |= conf.Width
+            values[conf.Y] = y
+        if width is not None and width != geom['width']:
+            geom['width'] = width
 
             if width <= 0:
                 width = 1
-            values.append(width)
-        if height is not None:
-            self.geom['height'] = height
-
-            mask |= conf.Height
+            values[conf.Width] = width
+        if height is not None and height != geom['height']:
+            geom['height'] = height
 
             if height <= 0:
                 height = 1
-            values.append(height)
-        if border_width is not None:
-            self.geom['border_width'] = border_width
-
-            mask |= conf.BorderWidth
-            values.append(border_width)
-        if sibling is not None:
-            mask |= conf.Sibling
-            values.append(sibling)
+            values[conf.Height] = height
+        if (border_width is not None and
+            border_width != geom['border_width']):
+            geom['border_width'] = border_width
+
+            values[conf.BorderWidth] = border_width
+
         if stack_mode is not None:
-            mask |= conf.StackMode
-            values.append(stack_mode)
+            values[conf.StackMode] = stack_mode
+            if sibling is not None:
+                values[conf.Sibling] = sibling
 
-        core.ConfigureWindow(self.id, mask, values)
+        queue_configure(self.id, values)
+
+        if stack_mode is not None:
+            flush_configures(self.id)
 
 class GeometryWindow(SimpleWindow):
     def __init__(self, wid):
         SimpleWindow.__init__(self, wid)
 
-        self._geom = core.GetGeometry(self.id)
+        # Only ask for the geometry of windows that aren't ours
+        self._geom = created_geom(wid)
+        if self._geom is None:
+            self._geom = core.GetGeometry(self.id)
 
     @property
     def geom(self):
@@ -121,6 +205,17 @@ class Window(GeometryWindow):
         self._wmname = ewmh.get_wm_name(conn, self.id)
         self._wmclass = icccm.get_wm_class(conn, self.id)
 
+    def resolve(self):
+        """
+        Waits for every reply that was requested when this window object was
+        created. This is useful to find out if the window has disappeared in
+        the mean time (an xproto.BadWindow or BadDrawable is raised), before
+        it matters.
+        """
+        return (self.geom, self.properties, self.protocols, self.hints,
+                self.normal_hints, self.cls, self.motif, self.wmname,
+                self.wmclass)
+
     def validate_size(self, width, height):
         nm = self.normal_hints
 
@@ -218,6 +313,10 @@ class Window(GeometryWindow):
 
         return self._hints
 
+    @hints.setter
+    def hints(self, value):
+        self._hints = value
+
     @property
     def normal_hints(self):
         if isinstance(self._normal_hints, icccm.NormalHintsCookie):
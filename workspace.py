@@ -10,7 +10,7 @@ import layout
 import monitor
 
 state.workspaces = OrderedDict()
-_current = __visible = __hidden = None
+_current = None
 
 def determine_focus():
     client = focus.focused()
@@ -36,10 +36,10 @@ def current():
     return _current
 
 def visible():
-    return __visible
+    return [w for w in state.workspaces.itervalues() if w.monitor is not None]
 
 def hidden():
-    return __hidden
+    return [w for w in state.workspaces.itervalues() if w.monitor is None]
 
 def names():
     return [w.name for w in state.workspaces]
@@ -50,24 +50,36 @@ def view_name(name, focusing=True):
     return view(state.workspaces[name], focusing=focusing)
 
 def view(workspace, focusing=True):
-    global _current, __visible, __hidden
+    global _current
     if workspace not in state.workspaces.values() or workspace == _current:
         return False
 
     old = _current
     _current = workspace
 
-    old.replace(_current)
+    # START GRAB
+    state.grab()
+    try:
+        # If it's already showing on another head, the two trade places.
+        other = workspace.monitor
+        if other is not None:
+            workspace.hide()
 
-    if focusing:
-        focus.fallback()
+        old.replace(_current)
+
+        if other is not None:
+            old.show(other)
+
+        if focusing:
+            focus.fallback()
+    finally:
+        state.ungrab()
+    # END GRAB
 
     return True
 
 def get_clients(workspace):
-    for _, client in state.windows.iteritems():
-        if workspace == client.workspace:
-            yield client
+    return workspace.clients()
 
 def tile(layoutClass=None):
     _current.tile(layoutClass=layoutClass)
@@ -107,6 +119,7 @@ def __get_right():
 class Workspace(object):
     def __init__(self, name):
         self.__name = name
+        self.__clients = set()
         self.monitor = None
         self.__workarea = {}
         self.floater = layout.floater.FloatLayout(self)
@@ -142,26 +155,26 @@ class Workspace(object):
         else:
             self.alternate.place()
 
-        for client in state.windows.itervalues():
-            if client.workspace is self:
-                client.maplight()
+        for client in self.clients():
+            client.maplight()
 
     def hide(self):
         if self.alternate is None:
             self.floater.save_all()
 
-        for client in state.windows.itervalues():
-            if client.workspace is self:
-                client.unmap(light=True)
+        for client in self.clients():
+            client.unmap(light=True)
         self.monitor = None
 
     def replace(self, workspace):
         if self is workspace:
             return
 
+        # Show the new workspace first, so that the windows being hidden
+        # mostly uncover other windows instead of the root window.
         monitor = self.monitor
-        self.hide()
         workspace.show(monitor)
+        self.hide()
 
     def focus(self):
         client = focus.focus_workspace(self)
@@ -180,6 +193,8 @@ class Workspace(object):
                '%s is already on workspace %s' % (client, client.workspace)
 
         client.workspace = self
+        self.__clients.add(client)
+        focus.moved(client, None)
 
     def add_and_assign_layout(self, client):
         self.add(client)
@@ -191,9 +206,15 @@ class Workspace(object):
 
         self.hide_client(client)
         client.workspace = None
+        self.__clients.discard(client)
+        focus.moved(client, self)
 
         return True
 
+    def clients(self):
+        """Returns a list of every client on this workspace."""
+        return list(self.__clients)
+
     def hide_client(self, client):
         # Ensure that it is no longer in any layout
         if client in self.floater:
@@ -278,6 +299,4 @@ state.workspaces['two'] = Workspace('two')
 state.workspaces['one'].monitor = 0
 
 _current = state.workspaces['one']
-__visible = [state.workspaces['one']]
-__hidden = [state.workspaces['two']]
 
@@ -0,0 +1,48 @@
+"""
+Deferred handling of X errors for requests we don't want to wait on.
+
+Requests like SetInputFocus or GrabServer used to be sent checked, which
+means a round trip to the server every time. Instead, 'send' issues them
+unchecked and remembers their sequence numbers. Any error they cause shows
+up later while reading events (see 'events.read'), where it's matched back
+to the request that caused it and reported through the 'x_error' hook.
+"""
+from collections import OrderedDict
+
+import hooks
+import state
+
+# Requests that might still fail, keyed by the low 16 bits of their sequence
+# number (that's all an X error carries). Requests that succeed never hear
+# back from the server, so only the most recent ones are kept.
+__pending = OrderedDict()
+__pending_max = 1024
+
+def send(name, request, *args):
+    """
+    Issues an unchecked request, i.e., 'request' is something like
+    'state.core.SetInputFocus', and 'args' are its arguments. 'name' is used
+    to identify the request if an error comes back for it.
+    """
+    cookie = request(*args)
+
+    __pending[cookie.sequence & 0xffff] = (name, args)
+    while len(__pending) > __pending_max:
+        __pending.popitem(last=False)
+
+    return cookie
+
+def caught(err):
+    """
+    Handles an X error (an 'xcb.ProtocolException') that came back instead of
+    an event. If it was caused by a request issued with 'send', the 'x_error'
+    hook is fired with the error, and the name and arguments of the request.
+    """
+    error = err.args[0]
+    name, args = __pending.pop(error.sequence, (None, ()))
+
+    state.debug('X error %s (sequence %d) from %s%s' % (
+                err.__class__.__name__, error.sequence, name or 'unknown',
+                args))
+
+    hooks.fire('x_error', error, name, args)
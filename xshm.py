@@ -0,0 +1,135 @@
+"""
+An optional MIT-SHM transport for uploading images to the X server.
+
+When the MIT-SHM extension is available (and the X server is local), image
+data is copied into a shared memory segment and uploaded with ShmPutImage
+instead of being pushed through the socket with PutImage. If anything goes
+wrong while setting it up (no extension, a remote display, no SysV shared
+memory...), 'available' is False and callers should fall back to PutImage.
+
+The segment is used as a bump allocator. Each upload asks for a completion
+event, and once every outstanding upload has completed, the whole segment
+is free again. If an image doesn't fit, put_image returns False and the
+caller falls back to PutImage.
+"""
+from collections import deque
+import ctypes
+import ctypes.util
+
+import xcb
+import xcb.xproto as xproto
+
+try:
+    import xcb.shm as shm
+except ImportError:
+    shm = None
+
+import config
+import events
+from state import conn, core
+
+# Images smaller than this many bytes aren't worth the trouble.
+threshold = 4096
+
+available = False
+
+__ext = None
+__libc = None
+__seg = None
+__addr = None
+__size = 0
+__head = 0
+
+# The (start, end) offsets of uploads that haven't completed yet.
+# Completion events arrive in the order the uploads were issued.
+__pending = deque()
+
+def __init():
+    global available, __ext, __libc, __seg, __addr, __size
+
+    if shm is None or not config.get_option('render_shm'):
+        return
+
+    try:
+        __ext = conn(shm.key)
+        __ext.QueryVersion().reply()
+    except (xcb.ExtensionException, xproto.BadImplementation):
+        return
+
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return
+
+    __libc = ctypes.CDLL(libc_name, use_errno=True)
+    __libc.shmat.restype = ctypes.c_void_p
+    __libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    __libc.shmdt.argtypes = [ctypes.c_void_p]
+
+    size = config.get_option('render_shm_size')
+
+    # IPC_PRIVATE, IPC_CREAT | 0600
+    shmid = __libc.shmget(0, size, 0o1000 | 0o600)
+    if shmid < 0:
+        return
+
+    addr = __libc.shmat(shmid, None, 0)
+    if addr in (None, ctypes.c_void_p(-1).value):
+        __libc.shmctl(shmid, 0, None) # IPC_RMID
+        return
+
+    seg = conn.generate_id()
+    try:
+        # This is the one time we wait on the server, since attaching fails
+        # with BadAccess on remote displays.
+        __ext.AttachChecked(seg, shmid, True).check()
+    except xcb.ProtocolException:
+        __libc.shmdt(addr)
+        __libc.shmctl(shmid, 0, None)
+        return
+
+    # The segment is destroyed once both we and the server detach from it,
+    # so it can't leak if Pyndow goes away.
+    __libc.shmctl(shmid, 0, None)
+
+    __seg, __addr, __size = seg, addr, size
+    available = True
+
+    events.register_extension_event(shm.CompletionEvent, cb_CompletionEvent)
+
+def put_image(drawable, gc, width, height, depth, data):
+    """
+    Uploads ZPixmap image data to 'drawable' through shared memory.
+    Returns False if the image couldn't be uploaded this way, in which case
+    the caller is responsible for using PutImage instead.
+    """
+    global __head
+
+    if not available or len(data) < threshold:
+        return False
+
+    start, end = __head, __head + len(data)
+    if end > __size:
+        return False
+
+    ctypes.memmove(__addr + start, data, len(data))
+
+    __ext.PutImage(drawable, gc, width, height, 0, 0, width, height, 0, 0,
+                   depth, xproto.ImageFormat.ZPixmap, 1, __seg, start)
+
+    __pending.append((start, end))
+    __head = end
+
+    return True
+
+def cb_CompletionEvent(e):
+    global __head
+
+    if e.shmseg != __seg or not __pending:
+        return
+
+    __pending.popleft()
+
+    if not __pending:
+        __head = 0
+
+__init()